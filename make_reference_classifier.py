@@ -14,13 +14,11 @@ from docopt import docopt
 import logging
 import matplotlib.pyplot as plt
 import numpy as np
-import torch
 from torch.utils.data import DataLoader, Subset
 from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import SGDClassifier
 from src.rsgan import build_experiment
-from src.toygeneration import ProductDataset
-from src.utils import load_yaml, save_pickle, setseed
+from src.utils import load_yaml, save_pickle
 
 
 def main(args, cfg):
@@ -31,33 +29,38 @@ def main(args, cfg):
     logging.info("Loading training and validation sets")
     train_loader, val_loader = make_annotated_clean_frames_dataloaders(experiment)
 
-    # Convert into (n_pixel, n_channel), (n_pixel,) arrays for sklearn
-    logging.info("Converting datasets as arrays for sklearn")
-    X_train, y_train = dataset_as_arrays(train_loader, seed=cfg['experiment']['seed'])
-    X_val, y_val = dataset_as_arrays(val_loader, seed=cfg['experiment']['seed'])
+    # Collect pixel labels from first time step annotations of training set
+    logging.info("Collecting pixel labels of training set")
+    classes = collect_classes(train_loader)
 
-    # Fit classifier to testing set
+    # Fit classifier to training set by streaming shuffled minibatches of pixel time series
     classifier_cfg = cfg['reference_classifier']
-    rf = fit_classifier_by_chunks(X_train=X_train[:classifier_cfg['train_set_size']],
-                                  y_train=y_train[:classifier_cfg['train_set_size']],
-                                  l2_weight=classifier_cfg['l2_weight'],
-                                  n_chunks=classifier_cfg['n_chunks'],
-                                  tol=classifier_cfg['tol'],
-                                  seed=classifier_cfg['seed'],
-                                  n_jobs=int(args['--njobs']))
+    lr = fit_classifier_by_minibatches(train_loader=train_loader,
+                                       classes=classes,
+                                       l2_weight=classifier_cfg['l2_weight'],
+                                       n_epochs=classifier_cfg['n_epochs'],
+                                       batch_size=classifier_cfg['batch_size'],
+                                       buffer_size=classifier_cfg['buffer_size'],
+                                       seed=classifier_cfg['seed'],
+                                       shuffle_seed=cfg['experiment']['seed'],
+                                       n_jobs=int(args['--njobs']))
 
     # Dump classifier at specified location
     dump_path = args['--o']
     logging.info(f"Saving classifier at {dump_path}")
-    save_pickle(dump_path, rf)
+    save_pickle(dump_path, lr)
+
+    # Accumulate confusion matrix over validation set
+    logging.info("Evaluating classifier on validation set")
+    cm = compute_confusion_matrix(val_loader, lr)
 
     # Compute and save accuracy
     logging.info("Computing accuracy on validation set")
-    compute_and_save_accuracy(X_val, y_val, rf, dump_path)
+    compute_and_save_accuracy(cm, dump_path)
 
     # Compute and save confusion matrix
     logging.info("Computing confusion matrix on validation set")
-    compute_and_save_confusion_matrix(X_val, y_val, rf, dump_path)
+    compute_and_save_confusion_matrix(cm, lr, dump_path)
 
 
 def make_annotated_clean_frames_dataloaders(experiment):
@@ -72,14 +75,10 @@ def make_annotated_clean_frames_dataloaders(experiment):
     horizon = experiment.test_set.dataset.horizon
 
     # Set normalization transform for frames
-    set_transform_recursively(concat_dataset=target_annotated_frames_dataset,
-                              transform=lambda x: (x - 0.5) / 0.5,
-                              attribute_name='frame_transform')
+    target_annotated_frames_dataset.set_frame_transform(lambda x: (x - 0.5) / 0.5)
 
     # Set pixel-label selection transform for annotation masks
-    set_transform_recursively(concat_dataset=target_annotated_frames_dataset,
-                              transform=lambda x: x[:, :, 1],
-                              attribute_name='annotation_transform')
+    target_annotated_frames_dataset.set_annotation_transform(lambda x: x[:, :, 1])
 
     # Build dataloaders restricted to corresponding indices sets
     train_indices = experiment.train_set.indices
@@ -94,37 +93,6 @@ def make_annotated_clean_frames_dataloaders(experiment):
     return train_loader, val_loader
 
 
-def set_transform_recursively(concat_dataset, transform, attribute_name):
-    """Used datasets results of recursive concatenation of ProductDataset
-    instances encapsulated under torch.data.utils.ConcatDataset instances as a
-    binary tree :
-
-                            +---+ConcatDataset+---+
-                            |                     |
-                            +                     +
-                 +---+ConcatDataset+---+    ProductDataset
-                 |                     |
-                 +                     +
-           ConcatDataset         ProductDataset
-                 +
-                 |
-                ...
-
-    However, we want to define transforms for the leaves ProductDataset instances,
-    we hence need to operate recursively
-
-    Args:
-        concat_dataset (torch.utils.data.ConcatDataset)
-        transform (callable): np.ndarray -> np.ndarray
-        attribute_name (str): attribute name where to set transform
-    """
-    concat_dataset.datasets[1].__setattr__(attribute_name, transform)
-    if isinstance(concat_dataset.datasets[0], ProductDataset):
-        concat_dataset.datasets[0].__setattr__(attribute_name, transform)
-    else:
-        set_transform_recursively(concat_dataset.datasets[0], transform, attribute_name)
-
-
 def make_dataloader_from_indices(dataset, batch_size, indices):
     """Builds dataloader from ordered time series dataset on specified indices
 
@@ -142,67 +110,145 @@ def make_dataloader_from_indices(dataset, batch_size, indices):
     return dataloader
 
 
-@setseed('numpy')
-def dataset_as_arrays(dataloader, seed):
-    """Drain out dataloader to load frames and labels into memory as numpy arrays,
-    ready to be fed to classifier
+def iterate_pixel_time_series(dataloader):
+    """Streams frames time series of dataloader as pixel time series, ready to
+    be fed to classifier
+
+    Each pixel time serie is a sample and channels at each time step are
+    features. Background pixels which we are not interested in classifying are
+    removed.
+
+    Args:
+        dataloader (torch.utils.data.DataLoader): loader of (horizon, height, width, channels)
+            frames time series and their annotation masks
+
+    Yields:
+        type: (np.ndarray, np.ndarray) as (n_pixel, horizon * channels), (n_pixel,)
     """
-    # Unpack frames and annotations
-    frames, annotations = list(zip(*iter(dataloader)))
+    for frames, annotations in dataloader:
+        # Reshape such that each pixel time serie is a sample and channels features + convert to numpy
+        horizon, height, width, channels = frames.shape
+        X = frames.permute(1, 2, 0, 3).reshape(-1, horizon * channels).numpy()
 
-    # Reshape such that each pixel time serie is a sample and channels features + convert to numpy
-    X = torch.stack(frames)
-    batch_size, horizon, height, width, channels = X.shape
-    X = X.permute(0, 2, 3, 1, 4).contiguous().view(-1, horizon * channels).numpy()
+        # Flatten time series annotation mask - we keep first time step only
+        y = annotations[0].flatten().numpy()
 
-    # Flatten time series annotation masks - we keep first time step only
-    y = torch.stack(annotations)[:, 0, :].flatten()
+        # Remove background pixels
+        foreground_pixels = y != 0
+        yield X[foreground_pixels], y[foreground_pixels]
 
-    # Shuffle jointly pixel and labels
-    shuffled_indices = np.random.permutation(len(X))
-    X = X[shuffled_indices]
-    y = y[shuffled_indices]
 
-    # Remove background pixels which we are not interested in classifying
-    foreground_pixels = y != 0
-    X, y = X[foreground_pixels], y[foreground_pixels]
-    return X, y
+def shuffle_by_reservoir(chunks, buffer_size, batch_size, seed=None):
+    """Shuffles stream of samples chunks within a bounded buffer and yields
+    shuffled minibatches
 
+    Incoming chunks are buffered until buffer holds at least buffer_size
+    samples. Buffer is then shuffled and all but buffer_size // 2 samples are
+    yielded by minibatches, the remaining half being mixed with next chunks.
 
-def fit_classifier_by_chunks(X_train, y_train, l2_weight, n_chunks, tol, seed, n_jobs):
-    """Fits classifier by chunk as dataset is to big to be fitted at once.
+    Args:
+        chunks (iterable[(np.ndarray, np.ndarray)]): stream of (samples, labels) chunks
+        buffer_size (int): number of buffered samples triggering shuffling
+        batch_size (int): number of samples per minibatch
+        seed (int): random seed (default: None)
+
+    Yields:
+        type: (np.ndarray, np.ndarray)
     """
-    # Instantiate logistic regression classifier
-    lr_kwargs = {'penalty': 'l2',
-                 'C': l2_weight,
-                 'solver': 'sag',
-                 'tol': tol,
-                 'n_jobs': n_jobs,
-                 'max_iter': 1000,
-                 'warm_start': True,
-                 'random_state': seed}
-    lr = LogisticRegression(**lr_kwargs)
+    rdm = np.random.RandomState(seed)
+    X_buffer, y_buffer, n_buffered = [], [], 0
+    for chunk_X, chunk_y in chunks:
+        X_buffer.append(chunk_X)
+        y_buffer.append(chunk_y)
+        n_buffered += len(chunk_X)
+        if n_buffered >= buffer_size:
+            # Shuffle buffer and yield all but half buffer size samples
+            shuffled_indices = rdm.permutation(n_buffered)
+            X, y = np.concatenate(X_buffer)[shuffled_indices], np.concatenate(y_buffer)[shuffled_indices]
+            n_yielded = n_buffered - buffer_size // 2
+            for i in range(0, n_yielded, batch_size):
+                end = min(i + batch_size, n_yielded)
+                yield X[i:end], y[i:end]
+            X_buffer, y_buffer, n_buffered = [X[n_yielded:]], [y[n_yielded:]], n_buffered - n_yielded
+
+    # Flush remaining buffered samples
+    if n_buffered > 0:
+        shuffled_indices = rdm.permutation(n_buffered)
+        X, y = np.concatenate(X_buffer)[shuffled_indices], np.concatenate(y_buffer)[shuffled_indices]
+        for i in range(0, n_buffered, batch_size):
+            yield X[i:i + batch_size], y[i:i + batch_size]
+
+
+def collect_classes(dataloader):
+    """Gathers foreground pixel labels from first time step annotation masks,
+    loading only first frame of each time serie
+
+    Args:
+        dataloader (torch.utils.data.DataLoader): loader of frames time series
+            restricted to a subset of indices
+
+    Returns:
+        type: np.ndarray
+    """
+    subset, horizon = dataloader.dataset, dataloader.batch_size
+    classes = set()
+    for i in range(0, len(subset), horizon):
+        _, annotation = subset[i]
+        classes.update(np.unique(annotation).tolist())
+    classes.discard(0)
+    return np.array(sorted(classes))
+
+
+def fit_classifier_by_minibatches(train_loader, classes, l2_weight, n_epochs, batch_size,
+                                  buffer_size, seed, shuffle_seed, n_jobs):
+    """Fits logistic regression classifier by stochastic gradient descent on
+    shuffled minibatches of pixel time series streamed from dataloader, such
+    that training set never has to fit in memory
+    """
+    # Instantiate logistic regression classifier trained by stochastic gradient descent
+    sgd_kwargs = {'loss': 'log',
+                  'penalty': 'l2',
+                  'alpha': l2_weight,
+                  'n_jobs': n_jobs,
+                  'random_state': seed}
+    lr = SGDClassifier(**sgd_kwargs)
     logging.info(lr)
 
-    # Fit to training dataset by chunks
-    chunks_iterator = zip(np.array_split(X_train, n_chunks), np.array_split(y_train, n_chunks))
-    for i, (chunk_X, chunk_y) in enumerate(chunks_iterator):
-        logging.info(f"Fitting Logistic Regression classifier on {len(chunk_X)} pixel time series")
-        lr.fit(chunk_X, chunk_y)
+    # Stream shuffled minibatches of training set at each epoch
+    rdm = np.random.RandomState(shuffle_seed)
+    for epoch in range(n_epochs):
+        minibatches = shuffle_by_reservoir(chunks=iterate_pixel_time_series(train_loader),
+                                           buffer_size=buffer_size,
+                                           batch_size=batch_size,
+                                           seed=rdm.randint(2**32))
+        n_samples = 0
+        for batch_X, batch_y in minibatches:
+            lr.partial_fit(batch_X, batch_y, classes=classes)
+            n_samples += len(batch_X)
+        logging.info(f"Epoch {epoch} - Fitted Logistic Regression classifier on {n_samples} pixel time series")
     return lr
 
 
-def compute_and_save_accuracy(X_val, y_val, classifier, dump_path):
-    val_accuracy = classifier.score(X_val, y_val)
+def compute_confusion_matrix(dataloader, classifier):
+    """Accumulates unnormalized confusion matrix of classifier over pixel
+    time series streamed from dataloader
+    """
+    cm = np.zeros((len(classifier.classes_), len(classifier.classes_)), dtype=np.int64)
+    for X, y in iterate_pixel_time_series(dataloader):
+        cm += confusion_matrix(y, classifier.predict(X), labels=classifier.classes_)
+    return cm
+
+
+def compute_and_save_accuracy(cm, dump_path):
+    val_accuracy = np.trace(cm) / cm.sum()
     val_accuracy_dump_path = os.path.join(os.path.dirname(dump_path), "accuracy.metric")
     with open(val_accuracy_dump_path, 'w') as f:
         f.write(str(val_accuracy))
     logging.info(f"Validation accuracy : {val_accuracy} - dumped at {val_accuracy_dump_path}")
 
 
-def compute_and_save_confusion_matrix(X_val, y_val, classifier, dump_path):
-    y_pred = classifier.predict(X_val)
-    cm = confusion_matrix(y_val, y_pred, labels=classifier.classes_, normalize='true')
+def compute_and_save_confusion_matrix(cm, classifier, dump_path):
+    cm = cm / cm.sum(axis=1, keepdims=True).clip(min=1)
     disp = ConfusionMatrixDisplay(confusion_matrix=cm,
                                   display_labels=classifier.classes_)
     confusion_matrix_dump_path = os.path.join(os.path.dirname(dump_path), "confusion_matrix.png")
@@ -1,6 +1,8 @@
 dvc run -v -f -n generate_toy_cloud_removal_dataset \
+-d run_toy_dataset_generation.py \
 -d run_toy_generation.py \
 -d run_toy_derivation.py \
+-d src/toygeneration/config/cloud_removal/pipeline.yaml \
 -d src/toygeneration/config/cloud_removal/optical/generation_latent_optical.yaml \
 -d src/toygeneration/config/cloud_removal/optical/derivation_clean_optical.yaml \
 -d src/toygeneration/config/cloud_removal/optical/derivation_clouded_optical.yaml \
@@ -1,6 +1,8 @@
 dvc run -v -f -n generate_toy_sar_to_optical_dataset \
+-d run_toy_dataset_generation.py \
 -d run_toy_generation.py \
 -d run_toy_derivation.py \
+-d src/toygeneration/config/sar_to_optical/pipeline.yaml \
 -d src/toygeneration/config/sar_to_optical/optical/generation_latent_optical.yaml \
 -d src/toygeneration/config/sar_to_optical/optical/derivation_optical.yaml \
 -d src/toygeneration/config/sar_to_optical/sar/generation_latent_sar.yaml \
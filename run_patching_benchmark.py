@@ -0,0 +1,98 @@
+"""
+Micro-benchmark of step by step product patching
+  (1) Builds random voronoi product with time series of random values
+  (2) Times frames generation with legacy patching, allocating a new frame and
+        annotation mask and patching them separately with Product.patch_array
+  (3) Times frames generation with in-place patching on reused buffers
+  (4) Checks both yield identical frames and annotation masks
+
+Usage: run_patching_benchmark.py [--size=<size>] [--polygons=<n_polygons>] [--horizon=<horizon>] [--nbands=<nbands>] [--repeat=<repeat>] [--seed=<seed>]
+
+Options:
+  -h --help                             Show help.
+  --version                             Show version.
+  --size=<size>                         Product height and width [default: 512]
+  --polygons=<n_polygons>               Number of polygons [default: 500]
+  --horizon=<horizon>                   Number of time steps [default: 50]
+  --nbands=<nbands>                     Number of bands [default: 3]
+  --repeat=<repeat>                     Number of timed runs [default: 3]
+  --seed=<seed>                         Random seed [default: 73]
+"""
+import time
+import numpy as np
+from docopt import docopt
+
+from src.toygeneration import PolygonArrayCell, Product, TimeSerie
+from src.toygeneration.modules import voronoi
+
+
+def main(args):
+    size, horizon = int(args['--size']), int(args['--horizon'])
+    product = build_product(size=size,
+                            n_polygons=int(args['--polygons']),
+                            horizon=horizon,
+                            nbands=int(args['--nbands']),
+                            seed=int(args['--seed']))
+
+    # Time both patching implementations
+    legacy_time = timeit(product, legacy_iterate_steps, repeat=int(args['--repeat']))
+    inplace_time = timeit(product, Product._iterate_steps, repeat=int(args['--repeat']))
+    print(f"Legacy patching   : {1000 * legacy_time / horizon:.2f} ms/step")
+    print(f"In-place patching : {1000 * inplace_time / horizon:.2f} ms/step (x{legacy_time / inplace_time:.2f})")
+
+    # Check outputs match
+    product.prepare()
+    legacy_steps = [(img.copy(), annotation.copy()) for img, annotation in legacy_iterate_steps(product)]
+    product.prepare()
+    for (legacy_img, legacy_annotation), (img, annotation) in zip(legacy_steps, product._iterate_steps()):
+        assert np.array_equal(legacy_img, img) and np.array_equal(legacy_annotation, annotation)
+    print("Outputs are identical")
+
+
+def build_product(size, n_polygons, horizon, nbands, seed):
+    """Builds product of voronoi polygon cells with random time series
+    """
+    polygons = voronoi.generate_voronoi_polygons(n=n_polygons, seed=seed)
+    product = Product(size=(size, size), nbands=nbands, horizon=horizon, seed=seed)
+    rdm = np.random.RandomState(seed)
+    for polygon in polygons:
+        time_serie = TimeSerie(ts=rdm.rand(horizon, nbands), label=rdm.randint(1, 10), horizon=horizon)
+        cell = PolygonArrayCell(polygon=polygon, product_size=(size, size), time_serie=time_serie)
+        product.register(cell, cell.get_center_loc())
+    return product
+
+
+def legacy_iterate_steps(product):
+    """Step by step generation allocating and patching frame and annotation
+    mask separately at each time step
+    """
+    for i in range(product.horizon):
+        img = product.bg.array.copy()
+        annotation = np.zeros(img.shape[:2] + (product.annotation_bands,))
+        for idx, (loc, blob) in product.items():
+            patch, annotation_mask = next(blob)
+            product.patch_array(img, patch, loc)
+            product.patch_array(annotation, annotation_mask, loc)
+        yield img, annotation
+
+
+def timeit(product, iterate_steps, repeat):
+    """Returns best time out of repeated full horizon runs, excluding product
+    preparation
+    """
+    timings = []
+    for _ in range(repeat):
+        product.prepare()
+        start = time.perf_counter()
+        for _ in iterate_steps(product):
+            pass
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    # Read input args
+    args = docopt(__doc__)
+
+    # Run benchmark
+    main(args)
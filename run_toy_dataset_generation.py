@@ -0,0 +1,200 @@
+"""
+Runs generation of a full toy dataset over a range of random seeds
+  (1) Loads time series datasets and GP cholesky decomposition once per worker
+  (2) For each seed, generates latent products and derives them as specified
+      in pipeline config file
+
+Unless latent products are to be kept, generated frames are streamed straight
+to degraders such that only derived products are ever dumped.
+
+Seeds are distributed across a pool of worker processes. Seeds whose derived
+products have all been completely dumped are skipped, such that an interrupted
+run can be resumed by executing the same command again.
+
+Usage: run_toy_dataset_generation.py --cfg=<pipeline_config_path> --o=<output_dir> [--seeds=<first:last>] [--njobs=<number_of_workers>] [--batch] [--rasterize]
+
+Options:
+  --cfg=<pipeline_config_path>  Path to pipeline config file
+  --o=<output_dir>              Path to dataset output directory
+  --seeds=<first:last>          Inclusive range of random seeds to generate [default: 1:250]
+  --njobs=<number_of_workers>   Number of worker processes [default: 1]
+  --batch                       Renders all time steps at once instead of step by step
+  --rasterize                   Gathers frames from a single label map instead of patching polygons
+"""
+import os
+import shutil
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from docopt import docopt
+import numpy as np
+from shapely.geometry import box
+
+import run_toy_generation
+import run_toy_derivation
+from src.toygeneration import PolygonCell, ProductDataset, derive_stream
+from src.toygeneration.export import ProductExport
+from src.utils import load_yaml
+
+
+# Worker process state, loaded once by _init_worker and reused across seeds
+_TS_DATASETS = {}
+
+
+def main(args, cfg):
+    first, last = map(int, args['--seeds'].split(':'))
+    seeds = list(range(first, last + 1))
+
+    # Skip seeds which have already been completely generated
+    todo = [seed for seed in seeds if not is_complete(cfg=cfg, seed_dir=seed_dir(args, seed))]
+    logging.info(f"Generating {len(todo)} seeds out of {len(seeds)} - {len(seeds) - len(todo)} already complete")
+
+    # Distribute seeds across workers
+    with ProcessPoolExecutor(max_workers=int(args['--njobs']),
+                             initializer=_init_worker,
+                             initargs=(cfg,)) as executor:
+        futures = {executor.submit(generate_seed, args, cfg, seed): seed for seed in todo}
+        for future in as_completed(futures):
+            future.result()
+            logging.info(f"Seed {futures[future]} complete")
+
+
+def seed_dir(args, seed):
+    return os.path.join(args['--o'], str(seed))
+
+
+def is_complete(cfg, seed_dir):
+    """Seed is complete if all derived products can be loaded. As index is
+    dumped last at export, a loadable index means the product is complete.
+    """
+    for name in cfg['derivation'].keys():
+        try:
+            ProductDataset(root=os.path.join(seed_dir, name))
+        except (OSError, KeyError, ValueError):
+            return False
+    return True
+
+
+def _init_worker(cfg):
+    """Loads time series datasets and computes GP cholesky decompositions
+    needed by generation configs such that each worker does it only once
+    """
+    logging.basicConfig(level=logging.INFO)
+    for generation_cfg_path in cfg['generation'].values():
+        generation_cfg = load_yaml(generation_cfg_path)
+        ts_key = _ts_key(generation_cfg)
+        if ts_key not in _TS_DATASETS:
+            _TS_DATASETS[ts_key] = run_toy_generation.load_ts_dataset(cfg=generation_cfg)
+        if generation_cfg['random_sampler']['name'] == 'gaussian_process':
+            size_max = _max_polygon_size(generation_cfg)
+            run_toy_generation.compute_cholesky_decomposition(cfg=generation_cfg, size_max=size_max)
+
+
+def _ts_key(generation_cfg):
+    ts_cfg = generation_cfg['ts']
+    return tuple(ts_cfg['path']), ts_cfg['ndim'], ts_cfg['nclass']
+
+
+def _max_polygon_size(generation_cfg):
+    """Size of a polygon covering the whole product, which bounds all polygons
+    sizes whatever the random seed
+    """
+    size = generation_cfg['product']['size']
+    aspect_ratio = size['width'] / size['height']
+    full_extent = box(0, 0, aspect_ratio, 1)
+    return np.max(PolygonCell.img_size_from_polygon(full_extent, (size['width'], size['height'])))
+
+
+def generate_seed(args, cfg, seed):
+    """Runs generation and derivation of all pipeline products for a given seed
+    """
+    output_dir = seed_dir(args, seed)
+    if os.path.exists(output_dir):
+        # Clear partial products from an interrupted run
+        shutil.rmtree(output_dir)
+
+    if cfg['keep_latent']:
+        generate_and_derive(args, cfg, seed, output_dir)
+    else:
+        stream_and_derive(args, cfg, seed, output_dir)
+
+
+def generate_and_derive(args, cfg, seed, output_dir):
+    """Dumps latent products and derives them by reading them back
+    """
+    # Run latent products generation
+    for name, generation_cfg_path in cfg['generation'].items():
+        generation_cfg = load_generation_cfg(generation_cfg_path, seed)
+        generation_args = {'--o': os.path.join(output_dir, name),
+                           '--batch': args['--batch'],
+                           '--rasterize': args['--rasterize']}
+        run_toy_generation.main(args=generation_args,
+                                cfg=generation_cfg,
+                                ts_dataset=_TS_DATASETS[_ts_key(generation_cfg)],
+                                compute_cholesky=False)
+
+    # Run derivations in specified order
+    for name, derivation in cfg['derivation'].items():
+        derivation_cfg = load_yaml(derivation['cfg'])
+        derivation_cfg.update({'latent_product_path': os.path.join(output_dir, derivation['product'])})
+        derivation_args = {'--o': os.path.join(output_dir, name)}
+        run_toy_derivation.main(args=derivation_args, cfg=derivation_cfg)
+
+    # Release file handles on products read at derivation
+    ProductDataset._handles_pool.close()
+
+
+def stream_and_derive(args, cfg, seed, output_dir):
+    """Streams latent products frames to degraders without dumping them
+    """
+    for name, generation_cfg_path in cfg['generation'].items():
+        # Build latent product
+        generation_cfg = load_generation_cfg(generation_cfg_path, seed)
+        product = run_toy_generation.build_product(cfg=generation_cfg,
+                                                   ts_dataset=_TS_DATASETS[_ts_key(generation_cfg)],
+                                                   compute_cholesky=False)
+
+        # Derive all products stemming from latent product in a single pass
+        frames = product.stream(batch=args['--batch'], rasterize=args['--rasterize'])
+        derive_stream(frames=frames,
+                      index=ProductExport.generation_index_of(product),
+                      derivations=make_derivations_from(cfg, name, output_dir))
+
+
+def load_generation_cfg(generation_cfg_path, seed):
+    """Loads generation config for specified seed
+    """
+    generation_cfg = load_yaml(generation_cfg_path)
+    generation_cfg.update({'seed': seed})
+    return generation_cfg
+
+
+def make_derivations_from(cfg, latent_name, output_dir):
+    """Builds derivations specifications of all products stemming from
+    specified latent product - see derive_stream
+    """
+    derivations = dict()
+    for name, derivation in cfg['derivation'].items():
+        if derivation['product'] == latent_name or derivation['product'] in derivations:
+            derivation_cfg = load_yaml(derivation['cfg'])
+            source = derivation['product'] if derivation['product'] != latent_name else None
+            derivations[name] = {'degrader': run_toy_derivation.build_degrader(cfg=derivation_cfg),
+                                 'output_dir': os.path.join(output_dir, name),
+                                 'source': source,
+                                 'astype': derivation_cfg['astype'],
+                                 'compression': derivation_cfg['compression']}
+    return derivations
+
+
+if __name__ == "__main__":
+    # Read input args
+    args = docopt(__doc__)
+
+    # Setup logging
+    logging.basicConfig(level=logging.INFO)
+    logging.info(f'arguments: {args}')
+
+    # Load configuration file
+    cfg = load_yaml(args["--cfg"])
+
+    # Run dataset generation
+    main(args, cfg)
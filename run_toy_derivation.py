@@ -25,6 +25,21 @@ def main(args, cfg):
     # Load latent product as product dataset
     latent_dataset = load_product_dataset(cfg=cfg)
 
+    # Instantiate degrader
+    degrader = build_degrader(cfg=cfg)
+
+    # Derive product from latent dataset
+    degrader.derive(product_set=latent_dataset,
+                    output_dir=args['--o'],
+                    astype=cfg['astype'],
+                    compression=cfg['compression'],
+                    batch_size=cfg['batch_size'])
+
+
+def build_degrader(cfg):
+    """Instantiates degrader with augmentation procedure and aggregation
+    operator specified in cfg
+    """
     # Define augmentation procedure
     corruption_transform = transforms.build_transform(cfg=cfg['corruption'])
     geometric_transform = transforms.build_transform(cfg=cfg['deformation'])
@@ -39,9 +54,7 @@ def main(args, cfg):
                              geometric_transform=geometric_transform,
                              postprocess_transform=postprocess_transform,
                              aggregate_fn=aggregate_fn)
-
-    # Derive product from latent dataset
-    degrader.derive(product_set=latent_dataset, output_dir=args['--o'])
+    return degrader
 
 
 def load_product_dataset(cfg):
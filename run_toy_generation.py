@@ -4,30 +4,49 @@ Runs generation of a toy synthetic imagery product based on voronoi polygons
   (2) Instantiates product and register polygons
   (3) Generate toy product frames and dump at specified location
 
-Usage: run_generation.py --cfg=<config_file_path>  --o=<output_dir> [--seed=<random_seed>]
+Usage: run_generation.py --cfg=<config_file_path>  --o=<output_dir> [--seed=<random_seed>] [--batch] [--rasterize]
 
 Options:
   --cfg=<config_path>   Path to config file
   --o=<output_path>     Path to output file
   --seed=<random_seed>  Random seed to use for generation
+  --batch               Renders all time steps at once instead of step by step
+  --rasterize           Gathers frames from a single label map instead of patching polygons
 """
 from docopt import docopt
 import numpy as np
 from scipy import stats
 import logging
 
-from src.toygeneration import PolygonCell, Product, TSDataset, TimeSerie
-from src.toygeneration.modules import GPSampler, voronoi, kernels
+from src.toygeneration import PolygonCell, PolygonArrayCell, Product, TSDataset, TimeSerie
+from src.toygeneration.modules import GPSampler, CirculantEmbeddingSampler, voronoi, kernels, samplers
 from src.toygeneration.timeserie import utils as ts_utils
 from src.utils import load_yaml
 
 
-def main(args, cfg):
+def main(args, cfg, ts_dataset=None, compute_cholesky=True):
+    # Build product with registered polygons
+    product = build_product(cfg=cfg,
+                            ts_dataset=ts_dataset,
+                            compute_cholesky=compute_cholesky)
+
+    # Generate and dump product
+    product.generate(output_dir=args['--o'],
+                     astype=cfg['astype'],
+                     batch=args['--batch'],
+                     rasterize=args['--rasterize'],
+                     compression=cfg['compression'])
+
+
+def build_product(cfg, ts_dataset=None, compute_cholesky=True):
+    """Instantiates product and registers voronoi polygons animated with time
+    series from dataset, ready for generation
+    """
     # Generate voronoi polygons split of image
     polygons = generate_voronoi_polygons(cfg=cfg)
 
     # Setup time series dataset
-    ts_dataset = make_ts_dataset(cfg=cfg)
+    ts_dataset = make_ts_dataset(cfg=cfg, ts_dataset=ts_dataset)
 
     # Instantiate product
     product = make_product(cfg=cfg)
@@ -36,10 +55,9 @@ def main(args, cfg):
     register_polygons(cfg=cfg,
                       product=product,
                       polygons=polygons,
-                      ts_dataset=ts_dataset)
-
-    # Generate and dump product
-    product.generate(output_dir=args['--o'], astype=cfg['astype'])
+                      ts_dataset=ts_dataset,
+                      compute_cholesky=compute_cholesky)
+    return product
 
 
 def generate_voronoi_polygons(cfg):
@@ -56,17 +74,27 @@ def generate_voronoi_polygons(cfg):
     return polygons
 
 
-def make_ts_dataset(cfg):
+def load_ts_dataset(cfg):
     """Loads time serie dataset from path specified in cfg
     """
     ts_cfg = cfg['ts']
     logging.info(f"Loading Time Series Dataset from {ts_cfg['path']}")
 
     # Setup TS dataset and artificially keep nb of dims and labels specified
-    ts_dataset = TSDataset(root=ts_cfg['path'][0], ndim=ts_cfg['ndim'], nclass=ts_cfg['nclass'])
+    ts_kwargs = {'ndim': ts_cfg['ndim'], 'nclass': ts_cfg['nclass'], 'cache_dir': ts_cfg['cache_dir']}
+    ts_dataset = TSDataset(root=ts_cfg['path'][0], **ts_kwargs)
     for ts_path in ts_cfg['path'][1:]:
-        other_dataset = TSDataset(root=ts_path, ndim=ts_cfg['ndim'], nclass=ts_cfg['nclass'])
+        other_dataset = TSDataset(root=ts_path, **ts_kwargs)
         ts_dataset = ts_dataset + other_dataset
+    return ts_dataset
+
+
+def make_ts_dataset(cfg, ts_dataset=None):
+    """Loads time serie dataset from path specified in cfg unless an already
+    loaded one is provided, and draws polygons labels sequence
+    """
+    if ts_dataset is None:
+        ts_dataset = load_ts_dataset(cfg=cfg)
 
     # Draw list of labels for polygons according to label distribution
     labels_dist = ts_utils.discretize_over_points(stats_dist=stats.uniform,
@@ -98,8 +126,12 @@ def make_random_sampler(cfg):
     """
     sampler_cfg = cfg['random_sampler']
     if sampler_cfg['name'] == 'gaussian_process':
+        kernel = kernels.build_kernel(cfg=sampler_cfg['kernel'])
         sampler = GPSampler(mean=lambda x: np.zeros(x.shape[0]),
-                            kernel_name=sampler_cfg['kernel']['name'])
+                            kernel=kernel)
+    elif sampler_cfg['name'] == 'gaussian_process_fft':
+        kernel = kernels.build_kernel(cfg=sampler_cfg['kernel'])
+        sampler = CirculantEmbeddingSampler(kernel=kernel)
     elif sampler_cfg['name'] == 'gaussian':
         std = sampler_cfg['std']
         sampler = lambda size: std * np.random.randn(*size)
@@ -108,45 +140,50 @@ def make_random_sampler(cfg):
     return sampler
 
 
-def compute_cholesky_decomposition(cfg, product, polygons):
+def compute_cholesky_decomposition(cfg, size_max):
+    """Computes and caches cholesky decomposition of (size_max, size_max) GP
+    covariance matrix, smaller sampling sizes use cropped versions of it.
+    If a cache directory is specified, decomposition is persisted across runs
+    """
     kernel_cfg = cfg['random_sampler']['kernel']
     kernel = kernels.build_kernel(cfg=kernel_cfg)
-    size_max = np.max([PolygonCell.img_size_from_polygon(p, product.size) for p in polygons])
+    samplers.CHOLESKY.cache_dir = cfg['random_sampler']['cache_dir']
 
     logging.info(f'Computing Cholesky decomposition of ({size_max},{size_max}) covariance matrix')
-    GPSampler._cache_cholesky(name=kernel_cfg['name'],
-                              size=(size_max, size_max),
+    GPSampler._cache_cholesky(size=(size_max, size_max),
                               kernel=kernel)
 
 
-def register_polygons(cfg, product, polygons, ts_dataset):
-    """Handles PolygonCell intialization with time serie and registration
-    to product
+def register_polygons(cfg, product, polygons, ts_dataset, compute_cholesky=True):
+    """Handles PolygonArrayCell intialization with time serie and registration
+    to product. Set compute_cholesky to False if a large enough cholesky
+    decomposition has already been cached
     """
     # Compute and cache choleski decomposition from largest polygon size
-    if cfg['random_sampler']['name'] == 'gaussian_process':
-        compute_cholesky_decomposition(cfg, product, polygons)
+    if cfg['random_sampler']['name'] == 'gaussian_process' and compute_cholesky:
+        size_max = np.max([PolygonCell.img_size_from_polygon(p, product.size) for p in polygons])
+        compute_cholesky_decomposition(cfg, size_max)
 
     # Get polygons label sequence
     label_sequence = ts_dataset._labels_order_list
     logging.info(f"Registering polygons with label sequence {label_sequence[:30]}...")
 
-    for polygon, label in zip(polygons, label_sequence):
-        # Draw random time serie from dataset
-        ts_array, ts_label = ts_dataset.choice(label=label)
+    # Create sampler instance shared by polygons such that spatial noise is drawn in a single batch
+    sampler = make_random_sampler(cfg)
+
+    # Draw random time series from dataset for all polygons at once
+    ts_samples = ts_dataset.choice_many(labels=label_sequence[:len(polygons)])
 
+    for polygon, (ts_array, ts_label) in zip(polygons, ts_samples):
         # Create time serie instance with same or greater horizon
         time_serie = TimeSerie(ts=ts_array, label=ts_label, horizon=product.horizon)
 
-        # Create sampler instance
-        sampler = make_random_sampler(cfg)
-
         # Encapsulate at digit level
         cell_kwargs = {'polygon': polygon,
                        'product_size': (product.size[1], product.size[0]),
                        'time_serie': time_serie,
                        'sampler': sampler}
-        cell = PolygonCell(**cell_kwargs)
+        cell = PolygonArrayCell(**cell_kwargs)
 
         # Register to product
         loc = cell.get_center_loc()
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from torch.utils.data import Dataset
 import torchvision.transforms as transforms
+from src.toygeneration import ProductDataset
 
 
 class ToyDataset(Dataset, ABC):
@@ -11,10 +12,14 @@ class ToyDataset(Dataset, ABC):
         root (str): path to dataset root directory containing subdirectories of
             ProductDataset
         use_annotations (bool): if True, also loads time series annotation mask
+        max_open_files (int): upper bound on number of product files kept open
+            for reuse across epochs, see ProductDataset (default: None, keeps
+            default pool size)
     """
-    def __init__(self, root, use_annotations):
+    def __init__(self, root, use_annotations, max_open_files=None):
         self.root = root
         self.use_annotations = use_annotations
+        self.max_open_files = max_open_files
         self.frames_transform = transforms.Compose([transforms.ToTensor(),
                                                     transforms.Normalize(mean=0.5,
                                                                          std=0.5)])
@@ -24,19 +29,26 @@ class ToyDataset(Dataset, ABC):
     def _load_datasets(self):
         """Loads and concatenates datasets from multiple views
 
-        torch.utils.Dataset instances can be concatenated as simply as
-        ```
-        concatenated_dataset = dataset_1 + dataset_2
-        ```
-        We hence here load datasets corresponding to each set of generated polygons -
-        i.e. with a different seed - into lists and obtain the concatenated datasets
-        by reducing these lists with addition operator
+        Products corresponding to each set of generated polygons - i.e. with a
+        different seed - are concatenated as a single flat MultiProductDataset
+        for each view
 
         Returns:
-            type: tuple[ProductDataset]
+            type: tuple[MultiProductDataset]
         """
         pass
 
+    def _set_max_open_files(self, datasets):
+        """Sizes pool of open product files to number of files of loaded
+        datasets, up to max_open_files
+
+        Args:
+            datasets (tuple[MultiProductDataset])
+        """
+        if self.max_open_files:
+            n_files = sum(dataset.n_files for dataset in datasets)
+            ProductDataset.set_max_open_files(max(min(n_files, self.max_open_files), 1))
+
     def _set_horizon_value(self, product_dataset):
         """Sets dataset time series horizon value from reference product dataset
 
@@ -69,6 +81,10 @@ class ToyDataset(Dataset, ABC):
     def horizon(self):
         return self._horizon
 
+    @property
+    def max_open_files(self):
+        return self._max_open_files
+
     @property
     @abstractmethod
     def target_dataset(self):
@@ -94,6 +110,10 @@ class ToyDataset(Dataset, ABC):
     def horizon(self, horizon):
         self._horizon = horizon
 
+    @max_open_files.setter
+    def max_open_files(self, max_open_files):
+        self._max_open_files = max_open_files
+
     @classmethod
     def build(cls, cfg):
-        return cls(root=cfg['root'])
+        return cls(root=cfg['root'], max_open_files=cfg.get('max_open_files'))
@@ -1,7 +1,5 @@
 import os
-from operator import add
-from functools import reduce
-from src.toygeneration import ProductDataset
+from src.toygeneration import MultiProductDataset
 from src.rsgan.data import DATASETS
 from .toy_dataset import ToyDataset
 
@@ -18,13 +16,15 @@ class ToySARToOptical(ToyDataset):
         root (str): path to dataset root directory containing subdirectories of
             ProductDataset
         use_annotations (bool): if True, also loads time series annotation mask
+        max_open_files (int): upper bound on number of product files kept open
     """
     _sar_dirname = "sar"
     _optical_dirname = "optical"
 
-    def __init__(self, root, use_annotations=False):
-        super().__init__(root=root, use_annotations=use_annotations)
+    def __init__(self, root, use_annotations=False, max_open_files=None):
+        super().__init__(root=root, use_annotations=use_annotations, max_open_files=max_open_files)
         buffer = self._load_datasets()
+        self._set_max_open_files(buffer)
         self.sar_dataset = buffer[0]
         self.optical_dataset = buffer[1]
         self._validate_datasets_length()
@@ -33,32 +33,20 @@ class ToySARToOptical(ToyDataset):
         """Loads and concatenates datasets from multiple views of optical and
         sar imagery
 
-        torch.utils.Dataset instances can be concatenated as simply as
-        ```
-        concatenated_dataset = dataset_1 + dataset_2
-        ```
-        We hence here load datasets corresponding to each set of generated polygons -
-        i.e. with a different seed - into lists and obtain the concatenated datasets
-        by reducing these lists with addition operator
+        Products corresponding to each set of generated polygons - i.e. with a
+        different seed - are concatenated as a single flat MultiProductDataset
+        for each view
 
         Returns:
-            type: tuple[ProductDataset]
+            type: tuple[MultiProductDataset]
         """
-        # Init empy dataset lists
-        sar_datasets = []
-        optical_datasets = []
-
         # Fill with datasets from each individual views
-        for seed in os.listdir(self.root):
-            sar_datasets += [ProductDataset(os.path.join(self.root, seed, self._sar_dirname))]
-            optical_datasets += [ProductDataset(os.path.join(self.root, seed, self._optical_dirname))]
+        seeds = os.listdir(self.root)
+        concatenated_sar_dataset = MultiProductDataset([os.path.join(self.root, seed, self._sar_dirname) for seed in seeds])
+        concatenated_optical_dataset = MultiProductDataset([os.path.join(self.root, seed, self._optical_dirname) for seed in seeds])
 
         # Set horizon value = time series length - supposed same across all datasets
-        self._set_horizon_value(optical_datasets[0])
-
-        # Concatenate into single datasets
-        concatenated_sar_dataset = reduce(add, sar_datasets)
-        concatenated_optical_dataset = reduce(add, optical_datasets)
+        self._set_horizon_value(concatenated_optical_dataset.datasets[0])
         return concatenated_sar_dataset, concatenated_optical_dataset
 
     def _validate_datasets_length(self):
@@ -1,2 +1,3 @@
 from .iqa import *
+from .batch_iqa import *
 from .classification import *
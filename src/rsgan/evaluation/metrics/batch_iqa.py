@@ -0,0 +1,237 @@
+import math
+import torch
+import torch.nn.functional as F
+from .iqa import _check_cw_ssim_size
+
+
+def batch_psnr(ref, tgt, data_range=1.):
+    """Computes peak signal to noise ratio of each band of a batch of target
+    images wrt to reference images - see iqa.psnr
+
+    Args:
+        ref (torch.Tensor): Reference images as (batch_size, channels, height, width)
+        tgt (torch.Tensor): Target images as (batch_size, channels, height, width)
+        data_range (float): images values range (default: 1, as inferred by
+            skimage for positive floating images)
+
+    Returns:
+        type: torch.Tensor as (batch_size, channels)
+    """
+    mse = (ref - tgt).pow(2).flatten(start_dim=2).mean(dim=-1)
+    return 10 * torch.log10(data_range ** 2 / mse)
+
+
+def batch_ssim(ref, tgt, window_size=7, data_range=2., gaussian_weights=False, K1=0.01, K2=0.03):
+    """Computes mean structural similarity index of each band of a batch of
+    target images wrt reference images - see iqa.ssim
+
+    Local statistics of all bands are computed at once by filtering the whole
+    batch with a uniform or gaussian window, restricted to valid positions as
+    skimage does when cropping borders before averaging
+
+    Args:
+        ref (torch.Tensor): Reference images as (batch_size, channels, height, width)
+        tgt (torch.Tensor): Target images as (batch_size, channels, height, width)
+        window_size (int): side-length of the uniform sliding window, ignored
+            if gaussian_weights (default: 7)
+        data_range (float): images values range (default: 2, as inferred by
+            skimage for floating images)
+        gaussian_weights (bool): if True, uses gaussian window of standard deviation 1.5
+        K1 (float): algorithm parameter (default: 0.01)
+        K2 (float): algorithm parameter (default: 0.03)
+
+    Returns:
+        type: torch.Tensor as (batch_size, channels)
+    """
+    batch_size, channels, height, width = ref.shape
+    x = ref.reshape(-1, 1, height, width)
+    y = tgt.reshape(-1, 1, height, width)
+
+    # Compute local means, variances and covariance in a single filtering pass
+    stats = torch.cat([x, y, x * x, y * y, x * y])
+    if gaussian_weights:
+        sigma, truncate = 1.5, 3.5
+        radius = int(truncate * sigma + 0.5)
+        window_size = 2 * radius + 1
+        coordinates = torch.arange(-radius, radius + 1, dtype=ref.dtype, device=ref.device)
+        window = torch.exp(-0.5 * (coordinates / sigma) ** 2)
+        window = window / window.sum()
+        stats = F.conv2d(stats, window.view(1, 1, -1, 1))
+        stats = F.conv2d(stats, window.view(1, 1, 1, -1))
+    else:
+        # Separable uniform filtering as means over sliding windows views
+        stats = stats.unfold(-1, window_size, 1).mean(dim=-1)
+        stats = stats.unfold(-2, window_size, 1).mean(dim=-1)
+    ux, uy, uxx, uyy, uxy = stats.chunk(5)
+
+    # Compute structural similarity map with in place operations, as only the
+    # sum of variances is needed - uses sample covariance
+    n_points = window_size ** 2
+    cov_norm = n_points / (n_points - 1)
+    C1 = (K1 * data_range) ** 2
+    C2 = (K2 * data_range) ** 2
+    ux_uy = ux * uy
+    ux2_uy2 = ux.pow(2).add_(uy.pow(2))
+    vx_vy = (uxx + uyy).sub_(ux2_uy2).mul_(cov_norm)
+    vxy = (uxy - ux_uy).mul_(cov_norm)
+    numerator = ux_uy.mul_(2).add_(C1).mul_(vxy.mul_(2).add_(C2))
+    denominator = ux2_uy2.add_(C1).mul_(vx_vy.add_(C2))
+    ssim_map = numerator.div_(denominator)
+    return ssim_map.flatten(start_dim=1).mean(dim=-1).view(batch_size, channels)
+
+
+def batch_sam(ref, tgt):
+    """Computes normalized Spectral Angle Mapper of each pixel of a batch of
+    target images wrt reference images - see iqa.sam
+
+    Args:
+        ref (torch.Tensor): Reference images as (batch_size, channels, height, width)
+        tgt (torch.Tensor): Target images as (batch_size, channels, height, width)
+
+    Returns:
+        type: torch.Tensor as (batch_size, height, width)
+    """
+    # Compute pixelwise bands inner product
+    kernel = torch.sum(ref * tgt, dim=1)
+
+    # Normalize inner products
+    eps = torch.finfo(torch.float16).eps
+    square_norm_ref = torch.sum(ref * ref, dim=1).clamp(min=eps)
+    square_norm_tgt = torch.sum(tgt * tgt, dim=1).clamp(min=eps)
+    normalized_kernel = kernel / torch.sqrt(square_norm_ref * square_norm_tgt)
+
+    # Convert to angles
+    normalized_angles = torch.acos(normalized_kernel.clamp(min=-1, max=1)) / 3.141592653589793
+    return normalized_angles
+
+
+def batch_cw_ssim(ref, tgt, n_scales=3, n_orientations=4, window_size=7, K=0.01):
+    """Computes complex wavelet structural similarity index of each band of a
+    batch of target images wrt reference images - see iqa.cw_ssim
+
+    Subbands of all bands of both batches are computed at once with FFTs on
+    images device, one subband at a time to bound memory usage, and local sums
+    are computed as sums over sliding windows views
+
+    Args:
+        ref (torch.Tensor): Reference images as (batch_size, channels, height, width)
+        tgt (torch.Tensor): Target images as (batch_size, channels, height, width)
+        n_scales (int): number of pyramid scales (default: 3)
+        n_orientations (int): number of subbands orientations (default: 4)
+        window_size (int): side-length of the sliding window (default: 7)
+        K (float): small algorithm parameter (default: 0.01)
+
+    Returns:
+        type: torch.Tensor as (batch_size, channels)
+    """
+    _check_cw_ssim_size(ref.shape[-2:], n_scales, window_size)
+    index = 0
+    subbands = batch_complex_steerable_pyramid(torch.stack([ref, tgt]),
+                                               n_scales=n_scales,
+                                               n_orientations=n_orientations)
+    for subband in subbands:
+        (ref_real, tgt_real), (ref_imag, tgt_imag) = subband.unbind(dim=-1)
+
+        # Compute local sums of cross-correlation and energy
+        cross_real = ref_real * tgt_real + ref_imag * tgt_imag
+        cross_imag = ref_imag * tgt_real - ref_real * tgt_imag
+        abs_cross = torch.sqrt(cross_real.pow(2) + cross_imag.pow(2))
+        square_abs = ref_real.pow(2) + ref_imag.pow(2) + tgt_real.pow(2) + tgt_imag.pow(2)
+        sum_abs_cross = _box_sum(abs_cross, window_size)
+        sum_square_abs = _box_sum(square_abs, window_size)
+        sum_cross_real = _box_sum(cross_real, window_size)
+        sum_cross_imag = _box_sum(cross_imag, window_size)
+
+        # Multiply magnitudes and phases consistency terms
+        abs_sum_cross = torch.sqrt(sum_cross_real.pow_(2).add_(sum_cross_imag.pow_(2)))
+        sum_abs_cross = sum_abs_cross.mul_(2).add_(K)
+        ssim_map = sum_abs_cross.div(sum_square_abs.add_(K))
+        ssim_map.mul_(abs_sum_cross.mul_(2).add_(K).div_(sum_abs_cross))
+
+        # Average local indices over positions and subbands
+        index = index + ssim_map.mean(dim=(-2, -1))
+    return index / (n_scales * n_orientations)
+
+
+def batch_complex_steerable_pyramid(images, n_scales=3, n_orientations=4):
+    """Decomposes images into oriented complex subbands at successive dyadic
+    scales with FFTs - see iqa.complex_steerable_pyramid
+
+    Complex tensors are represented as real tensors with a trailing dimension
+    of size 2 holding real and imaginary parts
+
+    Args:
+        images (torch.Tensor): (..., height, width) images
+        n_scales (int): number of scales
+        n_orientations (int): number of orientations
+
+    Yields:
+        type: torch.Tensor complex subbands as (..., height / 2^scale, width / 2^scale, 2)
+    """
+    # Angular masks normalization constant
+    order = n_orientations - 1
+    alpha = 2 ** order * math.factorial(order) / math.sqrt(n_orientations * math.factorial(2 * order))
+
+    spectrum = _fft2(torch.stack([images, torch.zeros_like(images)], dim=-1))
+    for scale in range(n_scales):
+        # Compute normalized frequencies polar coordinates
+        height, width = spectrum.shape[-3:-1]
+        rows_freqs = 2 * _fftfreq(height, spectrum)[:, None]
+        cols_freqs = 2 * _fftfreq(width, spectrum)[None, :]
+        radius = torch.sqrt(rows_freqs.pow(2) + cols_freqs.pow(2))
+        angle = torch.atan2(rows_freqs, cols_freqs)
+
+        # Split spectrum with raised cosine transition from 1/4 to 1/2 of Nyquist frequency
+        transition = torch.clamp(torch.log2(radius.clamp(min=torch.finfo(spectrum.dtype).eps)) + 2, 0, 1)
+        highpass_mask = torch.sin(0.5 * math.pi * transition)
+        lowpass_mask = torch.cos(0.5 * math.pi * transition)
+
+        # Decompose bandpass part in oriented complex subbands
+        for k in range(n_orientations):
+            angle_diff = torch.remainder(angle - math.pi * k / n_orientations + math.pi, 2 * math.pi) - math.pi
+            angular_mask = torch.cos(angle_diff).pow(order) * (angle_diff.abs() < math.pi / 2).to(spectrum.dtype)
+            bandpass_mask = 2 * alpha * highpass_mask * angular_mask
+            yield _fft2(spectrum * bandpass_mask[..., None], inverse=True)
+
+        # Downsample lowpass part by cropping central frequencies
+        half_height, half_width = height // 2, width // 2
+        top, left = height // 2 - half_height // 2, width // 2 - half_width // 2
+        lowpass = torch.roll(spectrum * lowpass_mask[..., None], shifts=(height // 2, width // 2), dims=(-3, -2))
+        lowpass = lowpass[..., top:top + half_height, left:left + half_width, :]
+        spectrum = torch.roll(lowpass, shifts=(-(half_height // 2), -(half_width // 2)), dims=(-3, -2))
+
+
+def _fft2(x, inverse=False):
+    """Computes 2-D discrete Fourier transform of complex tensor represented
+    as (..., height, width, 2) real tensor
+
+    Uses torch.fft module if available, else legacy torch.fft function (torch < 1.8)
+
+    Args:
+        x (torch.Tensor)
+        inverse (bool): if True, computes inverse transform
+
+    Returns:
+        type: torch.Tensor
+    """
+    if callable(torch.fft):
+        fft_fn = torch.ifft if inverse else torch.fft
+        return fft_fn(x, signal_ndim=2)
+    fft_fn = torch.fft.ifft2 if inverse else torch.fft.fft2
+    return torch.view_as_real(fft_fn(torch.view_as_complex(x)))
+
+
+def _fftfreq(n, like):
+    """Sample frequencies of discrete Fourier transform of size n, as
+    np.fft.fftfreq, with dtype and device of like tensor
+    """
+    k = torch.arange(n, dtype=like.dtype, device=like.device)
+    return torch.where(k < (n + 1) // 2, k, k - n) / n
+
+
+def _box_sum(x, size):
+    """Sums values of (..., height, width) tensor over sliding square windows,
+    restricted to valid positions
+    """
+    x = x.unfold(-1, size, 1).sum(dim=-1)
+    return x.unfold(-2, size, 1).sum(dim=-1)
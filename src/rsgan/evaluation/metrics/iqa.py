@@ -1,5 +1,6 @@
+import math
 import numpy as np
-from scipy import signal
+from scipy import fft, ndimage
 from skimage import metrics
 
 
@@ -73,44 +74,149 @@ def sam(ref, tgt, reduce=None):
     return output
 
 
-def cw_ssim(ref, tgt, width=30, K=0.01):
-    """Compute the complex wavelet SSIM (CW-SSIM) value from the reference
-    image to the target image.
+def cw_ssim(ref, tgt, n_scales=3, n_orientations=4, window_size=7, K=0.01, reduce='mean'):
+    """Computes complex wavelet structural similarity index (CW-SSIM) of
+    target images wrt reference images
 
-    "CW-SSIM based image classification", Gao et. al 2011
+    "Translation insensitive image similarity in complex wavelet domain",
+    Wang et. al 2005
 
-    Code based on https://github.com/jterrace/pyssim/blob/master/ssim/ssimlib.py
+    Images are decomposed with a complex steerable pyramid computed in the
+    Fourier domain. Local CW-SSIM indices are computed on sliding windows of
+    each subband and averaged over positions and subbands. Local index is the
+    product of magnitudes and phases consistency terms as in
+    https://github.com/jterrace/pyssim/blob/master/ssim/ssimlib.py
 
     Args:
-      ref (np.ndarray): Reference image as (height, width)
-      tgt (np.ndarray): Target image as (height, width)
-      width (int): width for the wavelet convolution (default: 30)
-      K (float): small algorithm parameter (default: 0.01)
+        ref (np.ndarray): Reference images as (..., height, width), e.g.
+            (batch_size, channels, height, width)
+        tgt (np.ndarray): Target images as (..., height, width)
+        n_scales (int): number of pyramid scales (default: 3)
+        n_orientations (int): number of subbands orientations (default: 4)
+        window_size (int): side-length of the sliding window (default: 7)
+        K (float): small algorithm parameter (default: 0.01)
+        reduce (str): output reduction method (default: 'mean')
+
+    Returns:
+        type: {np.ndarray, float}
+    """
+    _check_cw_ssim_size(ref.shape[-2:], n_scales, window_size)
+
+    # Decompose both images in complex subbands at once
+    subbands = complex_steerable_pyramid(np.stack([ref, tgt]),
+                                         n_scales=n_scales,
+                                         n_orientations=n_orientations)
+
+    subbands_indices = []
+    for ref_subband, tgt_subband in subbands:
+        # Compute magnitudes consistency term
+        cross = ref_subband * np.conj(tgt_subband)
+        sum_abs_cross = _box_sum(np.abs(cross), window_size)
+        sum_square_abs = _box_sum(np.square(ref_subband.real) + np.square(ref_subband.imag)
+                                  + np.square(tgt_subband.real) + np.square(tgt_subband.imag), window_size)
+        ssim_map = (2 * sum_abs_cross + K) / (sum_square_abs + K)
+
+        # Compute phases consistency term
+        abs_sum_cross = np.hypot(_box_sum(cross.real, window_size), _box_sum(cross.imag, window_size))
+        ssim_map *= (2 * abs_sum_cross + K) / (2 * sum_abs_cross + K)
+
+        # Average local indices over positions
+        subbands_indices.append(ssim_map.mean(axis=(-2, -1)))
+
+    # Average over subbands
+    index = np.mean(subbands_indices, axis=0)
+    if not reduce:
+        output = index
+    elif reduce == 'mean':
+        output = index.mean()
+    else:
+        raise ValueError("Unknown reduce method")
+    return output
+
+
+def complex_steerable_pyramid(images, n_scales=3, n_orientations=4):
+    """Decomposes images into oriented complex subbands at successive dyadic
+    scales with a complex steerable pyramid computed in the Fourier domain
+
+    "The steerable pyramid: a flexible architecture for multi-scale derivative
+    computation", Simoncelli et. al 1995
+
+    At each scale, spectrum is split with raised cosine log-radial masks into
+    a bandpass part, decomposed by one-sided angular masks into complex
+    oriented subbands, and a lowpass part which is downsampled by cropping
+    spectrum for next scale. Highpass residual is kept in finest subbands and
+    lowpass residual is discarded.
+
+    Args:
+        images (np.ndarray): (..., height, width) images
+        n_scales (int): number of scales
+        n_orientations (int): number of orientations
+
     Returns:
-      type: float
+        type: list[np.ndarray] complex subbands as (..., height / 2^scale, width / 2^scale)
+    """
+    # Angular masks normalization constant
+    order = n_orientations - 1
+    alpha = 2 ** order * math.factorial(order) / np.sqrt(n_orientations * math.factorial(2 * order))
+
+    spectrum = fft.fft2(np.asarray(images, dtype=np.float32), workers=-1)
+    subbands = []
+    for scale in range(n_scales):
+        # Compute normalized frequencies polar coordinates
+        height, width = spectrum.shape[-2:]
+        rows_freqs = 2 * fft.fftfreq(height).astype(np.float32)[:, None]
+        cols_freqs = 2 * fft.fftfreq(width).astype(np.float32)[None, :]
+        radius = np.hypot(rows_freqs, cols_freqs)
+        angle = np.arctan2(rows_freqs, cols_freqs)
+
+        # Split spectrum with raised cosine transition from 1/4 to 1/2 of Nyquist frequency
+        transition = np.clip(np.log2(radius.clip(min=np.finfo(np.float32).eps)) + 2, 0, 1)
+        highpass_mask = np.sin(0.5 * np.pi * transition)
+        lowpass_mask = np.cos(0.5 * np.pi * transition)
+
+        # Decompose bandpass part in oriented complex subbands
+        bandpass = spectrum * highpass_mask
+        for k in range(n_orientations):
+            angle_diff = np.mod(angle - np.pi * k / n_orientations + np.pi, 2 * np.pi) - np.pi
+            angular_mask = 2 * alpha * np.cos(angle_diff) ** order * (np.abs(angle_diff) < np.pi / 2)
+            subbands.append(fft.ifft2(bandpass * angular_mask.astype(np.float32), workers=-1))
+
+        # Downsample lowpass part by cropping central frequencies
+        lowpass = fft.fftshift(spectrum * lowpass_mask, axes=(-2, -1))
+        half_height, half_width = height // 2, width // 2
+        top, left = height // 2 - half_height // 2, width // 2 - half_width // 2
+        lowpass = lowpass[..., top:top + half_height, left:left + half_width]
+        spectrum = fft.ifftshift(lowpass, axes=(-2, -1))
+    return subbands
+
+
+def _box_sum(x, size):
+    """Sums values of (..., height, width) array over sliding square windows,
+    restricted to valid positions
+
+    Args:
+        x (np.ndarray)
+        size (int): window side-length
+
+    Returns:
+        type: np.ndarray as (..., height - size + 1, width - size + 1)
+    """
+    x = ndimage.uniform_filter1d(x, size=size, axis=-2)
+    x = ndimage.uniform_filter1d(x, size=size, axis=-1)
+    crop = size // 2, size - size // 2 - 1
+    x = x[..., crop[0]:x.shape[-2] - crop[1], crop[0]:x.shape[-1] - crop[1]]
+    return size ** 2 * x
+
+
+def _check_cw_ssim_size(image_size, n_scales, window_size):
+    """Checks coarsest pyramid subbands can hold a sliding window
+
+    Args:
+        image_size (tuple[int]): (height, width)
+        n_scales (int): number of pyramid scales
+        window_size (int): side-length of the sliding window
     """
-    # Define a width for the wavelet convolution
-    widths = np.arange(1, width + 1)
-
-    # Convolution
-    cwt1 = signal.cwt(ref.flatten(), signal.ricker, widths)
-    cwt2 = signal.cwt(tgt.flatten(), signal.ricker, widths)
-
-    # Compute the first term
-    c1c2 = np.abs(cwt1) * np.abs(cwt2)
-    c1_2 = np.square(np.abs(cwt1))
-    c2_2 = np.square(np.abs(cwt2))
-    numerator_ssim1 = 2 * c1c2.sum(axis=0) + K
-    denominator_ssim1 = c1_2.sum(axis=0) + c2_2.sum(axis=0) + K
-
-    # Compute the second term
-    c1c2_conj = cwt1 * np.conjugate(cwt2)
-    numerator_ssim2 = 2 * np.abs(c1c2_conj.sum(axis=0)) + K
-    denominator_ssim2 = 2 * np.abs(c1c2_conj).sum(axis=0) + K
-
-    # Construct the result
-    ssim_map = (numerator_ssim1 / denominator_ssim1) * (numerator_ssim2 / denominator_ssim2)
-
-    # Average the per pixel results
-    index = np.mean(ssim_map)
-    return index
+    coarsest_size = min(image_size) >> (n_scales - 1)
+    if coarsest_size < window_size:
+        raise ValueError(f"Images of size {tuple(image_size)} are too small for {n_scales} scales "
+                         f"and window of size {window_size}, coarsest subbands have size {coarsest_size}")
@@ -53,6 +53,7 @@ class cGANFrameRecurrentToyCloudRemoval(cGANToyCloudRemoval):
         optimizer_kwargs (dict): parameters of optimizer defined in LightningModule.configure_optimizers
         lr_scheduler_kwargs (dict): paramters of lr scheduler defined in LightningModule.configure_optimizers
         reference_classifier (sklearn.BaseEstimator): reference pixelwise timeserie classifier for evaluation
+        compute_cw_ssim (bool): if True, also computes CW-SSIM at testing (default: False)
         seed (int): random seed (default: None)
     """
     @staticmethod
@@ -379,12 +380,13 @@ class cGANFrameRecurrentToyCloudRemoval(cGANToyCloudRemoval):
                                                                          annotation)
 
         # Compute IQA metrics
-        psnr, ssim, sam = self._compute_iqa_metrics(generated_target, target)
+        psnr, ssim, cw_ssim, sam = self._compute_iqa_metrics(generated_target, target,
+                                                             compute_cw_ssim=self.compute_cw_ssim)
         mse = F.mse_loss(generated_target, target)
         mae = F.l1_loss(generated_target, target)
 
         # Encapsulate into torch tensor
-        output = torch.Tensor([mae, mse, psnr, ssim, sam, iou_generated, iou_real])
+        output = torch.Tensor([mae, mse, psnr, ssim, cw_ssim, sam, iou_generated, iou_real])
         return output
 
     def test_epoch_end(self, outputs):
@@ -398,7 +400,7 @@ class cGANFrameRecurrentToyCloudRemoval(cGANToyCloudRemoval):
         """
         # Average metrics
         outputs = torch.stack(outputs).mean(dim=0)
-        mae, mse, psnr, ssim, sam, iou_estimated, iou_real = outputs
+        mae, mse, psnr, ssim, cw_ssim, sam, iou_estimated, iou_real = outputs
         iou_ratio = iou_estimated / iou_real
 
         # Make and dump logs
@@ -410,6 +412,8 @@ class cGANFrameRecurrentToyCloudRemoval(cGANToyCloudRemoval):
                   'test_jaccard_generated_samples': iou_estimated.item(),
                   'test_jaccard_real_samples': iou_real.item(),
                   'test_jaccard_ratio': iou_ratio.item()}
+        if self.compute_cw_ssim:
+            output.update({'test_cw_ssim': cw_ssim.item()})
         return {'log': output}
 
     @property
@@ -46,11 +46,12 @@ class cGANToyCloudRemoval(ToyImageTranslationExperiment):
         optimizer_kwargs (dict): parameters of optimizer defined in LightningModule.configure_optimizers
         lr_scheduler_kwargs (dict): paramters of lr scheduler defined in LightningModule.configure_optimizers
         reference_classifier (sklearn.BaseEstimator): reference pixelwise timeserie classifier for evaluation
+        compute_cw_ssim (bool): if True, also computes CW-SSIM at testing (default: False)
         seed (int): random seed (default: None)
     """
     def __init__(self, generator, discriminator, dataset, split, dataloader_kwargs,
                  optimizer_kwargs, lr_scheduler_kwargs=None, l1_weight=None,
-                 reference_classifier=None, seed=None):
+                 reference_classifier=None, compute_cw_ssim=False, seed=None):
         super().__init__(model=generator,
                          dataset=dataset,
                          split=split,
@@ -59,6 +60,7 @@ class cGANToyCloudRemoval(ToyImageTranslationExperiment):
                          lr_scheduler_kwargs=lr_scheduler_kwargs,
                          criterion=nn.BCELoss(),
                          reference_classifier=reference_classifier,
+                         compute_cw_ssim=compute_cw_ssim,
                          seed=seed)
         self.l1_weight = l1_weight
         self.discriminator = discriminator
@@ -310,12 +312,13 @@ class cGANToyCloudRemoval(ToyImageTranslationExperiment):
                                                                          annotation)
 
         # Compute IQA metrics
-        psnr, ssim, sam = self._compute_iqa_metrics(generated_target, target)
+        psnr, ssim, cw_ssim, sam = self._compute_iqa_metrics(generated_target, target,
+                                                             compute_cw_ssim=self.compute_cw_ssim)
         mse = F.mse_loss(generated_target, target)
         mae = F.l1_loss(generated_target, target)
 
         # Encapsulate into torch tensor
-        output = torch.Tensor([mae, mse, psnr, ssim, sam, iou_generated, iou_real])
+        output = torch.Tensor([mae, mse, psnr, ssim, cw_ssim, sam, iou_generated, iou_real])
         return output
 
     def test_epoch_end(self, outputs):
@@ -329,7 +332,7 @@ class cGANToyCloudRemoval(ToyImageTranslationExperiment):
         """
         # Average metrics
         outputs = torch.stack(outputs).mean(dim=0)
-        mae, mse, psnr, ssim, sam, iou_estimated, iou_real = outputs
+        mae, mse, psnr, ssim, cw_ssim, sam, iou_estimated, iou_real = outputs
         iou_ratio = iou_estimated / iou_real
 
         # Make and dump logs
@@ -341,6 +344,8 @@ class cGANToyCloudRemoval(ToyImageTranslationExperiment):
                   'test_jaccard_generated_samples': iou_estimated.item(),
                   'test_jaccard_real_samples': iou_real.item(),
                   'test_jaccard_ratio': iou_ratio.item()}
+        if self.compute_cw_ssim:
+            output.update({'test_cw_ssim': cw_ssim.item()})
         return {'log': output}
 
     @property
@@ -385,7 +390,8 @@ class cGANToyCloudRemoval(ToyImageTranslationExperiment):
                         'seed': cfg['experiment']['seed']}
         if test:
             reference_classifier = load_pickle(cfg['testing']['reference_classifier_path'])
-            build_kwargs.update({'reference_classifier': reference_classifier})
+            build_kwargs.update({'reference_classifier': reference_classifier,
+                                 'compute_cw_ssim': cfg['testing'].get('compute_cw_ssim', False)})
         else:
             build_kwargs.update({'l1_weight': cfg['experiment']['l1_regularization_weight']})
         return build_kwargs
@@ -416,6 +422,7 @@ class cGANToyAlreadyClean(cGANToyCloudRemoval):
         optimizer_kwargs (dict): parameters of optimizer defined in LightningModule.configure_optimizers
         lr_scheduler_kwargs (dict): paramters of lr scheduler defined in LightningModule.configure_optimizers
         reference_classifier (sklearn.BaseEstimator): reference pixelwise timeserie classifier for evaluation
+        compute_cw_ssim (bool): if True, also computes CW-SSIM at testing (default: False)
         seed (int): random seed (default: None)
     """
     def train_dataloader(self):
@@ -4,7 +4,6 @@ from torch.utils.data import random_split, Subset
 import numpy as np
 from functools import reduce
 from operator import add
-from collections import defaultdict
 from sklearn.metrics import jaccard_score
 
 from src.utils import setseed
@@ -320,42 +319,39 @@ class ImageTranslationExperiment(Experiment):
         recall = metrics.recall(output, target)
         return fooling_rate, precision, recall
 
-    def _compute_iqa_metrics(self, estimated_target, target):
-        """Computes full reference image quality assessment metrics : psnr, ssim
-            and spectral angle mapper (see evaluation/metrics/iqa.py for details)
+    def _compute_iqa_metrics(self, estimated_target, target, compute_cw_ssim=False):
+        """Computes full reference image quality assessment metrics : psnr, ssim,
+            cw-ssim and spectral angle mapper (see evaluation/metrics/iqa.py for details)
+
+        CW-SSIM is several times more expensive than other metrics, hence only
+            computed if specified - nan otherwise
 
         Args:
             estimated_target (torch.Tensor): generated sample
             target (torch.Tensor): target sample
+            compute_cw_ssim (bool): if True, computes CW-SSIM
 
         Returns:
             type: tuple[float]
         """
-        # Reshape as (batch_size * channels, height, width) to run single for loop
-        batch_size, channels, height, width = target.shape
-        estimated_target = estimated_target.clamp(min=0).detach().cpu().numpy()
-        target = target.clamp(min=0).detach().cpu().numpy()
-        estimated_bands = estimated_target.reshape(-1, height, width)
-        target_bands = target.reshape(-1, height, width)
-
-        # Compute IQA metrics by band
-        iqa_metrics = defaultdict(list)
-        for src, tgt in zip(estimated_bands, target_bands):
-            data_range = np.max([src, tgt])
-            src = src / data_range
-            tgt = tgt / data_range
-            iqa_metrics['psnr'] += [metrics.psnr(tgt, src)]
-            iqa_metrics['ssim'] += [metrics.ssim(tgt, src)]
-
-        # Aggregate results - for now simple mean aggregation
-        psnr = np.mean(iqa_metrics['psnr'])
-        ssim = np.mean(iqa_metrics['ssim'])
+        # Normalize each band by its maximum value across both samples
+        estimated_target = estimated_target.detach().clamp(min=0)
+        target = target.detach().clamp(min=0)
+        data_range = torch.max(estimated_target.flatten(start_dim=2).max(dim=-1).values,
+                               target.flatten(start_dim=2).max(dim=-1).values)[..., None, None]
+        normalized_estimated_target = estimated_target / data_range
+        normalized_target = target / data_range
+
+        # Compute IQA metrics by band at once - for now simple mean aggregation
+        psnr = metrics.batch_psnr(normalized_target, normalized_estimated_target).mean().item()
+        ssim = metrics.batch_ssim(normalized_target, normalized_estimated_target).mean().item()
+        cw_ssim = float('nan')
+        if compute_cw_ssim:
+            cw_ssim = metrics.batch_cw_ssim(normalized_target, normalized_estimated_target).mean().item()
 
         # Compute spectral angle mapper
-        estimated_target = estimated_target.transpose(0, 2, 3, 1).astype(np.float32)
-        target = target.transpose(0, 2, 3, 1).astype(np.float32)
-        sam = metrics.sam(target, estimated_target, reduce='mean')
-        return psnr, ssim, sam
+        sam = metrics.batch_sam(target, estimated_target).mean().item()
+        return psnr, ssim, cw_ssim, sam
 
     def _compute_legitimacy_at_task_score(self, classifier, estimated_target, target, annotation):
         """Computes a score of how legitimate is a generated sample at replacing
@@ -434,7 +430,8 @@ class ImageTranslationExperiment(Experiment):
 
 class ToyImageTranslationExperiment(ImageTranslationExperiment):
     def __init__(self, model, dataset, split, dataloader_kwargs, optimizer_kwargs,
-                 lr_scheduler_kwargs, criterion=None, reference_classifier=None, seed=None):
+                 lr_scheduler_kwargs, criterion=None, reference_classifier=None,
+                 compute_cw_ssim=False, seed=None):
         super().__init__(model=model,
                          dataset=dataset,
                          split=split,
@@ -444,6 +441,7 @@ class ToyImageTranslationExperiment(ImageTranslationExperiment):
                          criterion=criterion,
                          seed=seed)
         self.reference_classifier = reference_classifier
+        self.compute_cw_ssim = compute_cw_ssim
 
     @staticmethod
     def _convert_split_ratios_to_length(total_length, split, horizon):
@@ -539,3 +537,11 @@ class ToyImageTranslationExperiment(ImageTranslationExperiment):
     @reference_classifier.setter
     def reference_classifier(self, classifier):
         self._reference_classifier = classifier
+
+    @property
+    def compute_cw_ssim(self):
+        return self._compute_cw_ssim
+
+    @compute_cw_ssim.setter
+    def compute_cw_ssim(self, compute_cw_ssim):
+        self._compute_cw_ssim = compute_cw_ssim
@@ -1,9 +1,10 @@
-from .blob import PolygonCell
-from .export import ProductDataset
+from .blob import PolygonCell, PolygonArrayCell
+from .export import ProductDataset, MultiProductDataset
 from .product import Product
 from .timeserie import TSDataset, TimeSerie
-from .derivation import Degrader
+from .derivation import Degrader, derive_stream
 from .modules import samplers
 
-__all__ = ['PolygonCell', 'Product', 'TSDataset', 'TimeSerie',
-           'ProductDataset', 'Degrader', 'samplers']
+__all__ = ['PolygonCell', 'PolygonArrayCell', 'Product', 'TSDataset', 'TimeSerie',
+           'ProductDataset', 'MultiProductDataset', 'Degrader', 'derive_stream',
+           'samplers']
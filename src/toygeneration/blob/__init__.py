@@ -1,3 +1,3 @@
-from .cell import PolygonCell
+from .cell import PolygonCell, PolygonArrayCell
 
-__all__ = ['PolygonCell']
+__all__ = ['PolygonCell', 'PolygonArrayCell']
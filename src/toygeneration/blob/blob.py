@@ -1,4 +1,5 @@
 from PIL import Image
+import itertools
 import numpy as np
 from src.utils import setseed
 
@@ -78,18 +79,59 @@ class Blob(Image.Image):
     def unfreeze(self):
         """Allows to iterate over blob and sets up attributes anticipating
         iteration
+
+        If a scale sampler is defined, scaling factors are drawn for the whole
+        horizon and blob masks are resized once for all upfront, steps with the
+        same quantized size sharing the same mask
         """
         self._static = False
         # Initialize timeserie
         if self.time_serie is not None:
             self._ts_iterator = iter(self.time_serie)
-        # Initialize scales sampler
+        # Initialize resized masks iterator
         if self.scale_sampler is not None:
             if self.time_serie is not None:
                 horizon = self.time_serie.horizon
             else:
                 horizon = self.scale_sampler.size
-            self._scale_iterator = iter(self.scale_sampler(size=horizon))
+            masks = self._resized_masks(scales=self.scale_sampler(size=(horizon,)))
+        else:
+            masks = itertools.repeat(self._mask_array(self))
+        self._mask_iterator = iter(masks)
+
+    def _resized_masks(self, scales):
+        """Computes blob masks resized by each scaling factor, masks of same
+        size being computed once and shared
+
+        Args:
+            scales (np.ndarray): sequence of scaling factors
+
+        Returns:
+            type: list[np.ndarray]
+        """
+        w, h = self.size
+        masks, masks_by_size = [], {}
+        for scale in scales:
+            new_size = int(np.floor(scale * w)), int(np.floor(scale * h))
+            if new_size not in masks_by_size:
+                masks_by_size[new_size] = self._mask_array(self.resize(new_size))
+            masks.append(masks_by_size[new_size])
+        return masks
+
+    @staticmethod
+    def _mask_array(img):
+        """Converts image as a read-only (height, width, 1) float32 mask valued
+        in [0, 1] to be broadcasted against time serie slices
+
+        Args:
+            img (PIL.Image.Image)
+
+        Returns:
+            type: np.ndarray
+        """
+        mask = np.asarray(img, dtype=np.float32)[..., None] / 255
+        mask.setflags(write=False)
+        return mask
 
     def asarray(self, cache=False):
         """Converts image as a (width, height, ndim) numpy array
@@ -109,23 +151,21 @@ class Blob(Image.Image):
             return img_array
 
     def _update_size(self):
-        """Draws next size scaling factor and creates new resized version of
-            blob
+        """Yields next precomputed blob mask, resized with next scaling factor
+        if a scale sampler is defined
+
         Returns:
-            type: Blob
+            type: np.ndarray
         """
-        if self.scale_sampler is not None:
-            scale = next(self._scale_iterator)
-            w, h = self.size
-            new_w, new_h = int(np.floor(scale * w)), int(np.floor(scale * h))
-            output = self.resize((new_w, new_h))
-        else:
-            output = self
-        return output
+        return next(self._mask_iterator)
 
     def _update_pixel_values(self, array):
         """Draws next pixel scaling vector and creates rescaled version of
-            blob as array
+            blob mask as array
+
+        Args:
+            array (np.ndarray): (height, width, 1) blob mask
+
         Returns:
             type: np.ndarray
         """
@@ -135,7 +175,7 @@ class Blob(Image.Image):
             scaled_array = array * ts_slice
             output = scaled_array
         else:
-            output = self.asarray()
+            output = np.broadcast_to(array, array.shape[:-1] + (self.ndim,))
         return output
 
     def __next__(self):
@@ -148,10 +188,10 @@ class Blob(Image.Image):
         if self.static:
             raise TypeError(f"{self} is not iterable, unfreeze to allow iteration")
         else:
-            # Resize blob with next scaling factor
-            blob = self._update_size()
+            # Get blob mask resized with next scaling factor
+            mask = self._update_size()
             # Rescale pixel values with next time serie values
-            blob = self._update_pixel_values(blob.asarray())
+            blob = self._update_pixel_values(mask)
             return blob
 
     def set_img(self, img):
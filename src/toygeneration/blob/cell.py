@@ -45,14 +45,20 @@ class PolygonCell(BinaryBlob):
         row, col = self.discretize_coordinates((mean_x, mean_y), self.product_size)
         return row, col
 
-    def unfreeze(self):
+    def unfreeze(self, spatial_noise=None):
         """Allows to iterate over blob and sets up attributes anticipating
         iteration
+
+        Args:
+            spatial_noise (np.ndarray): optional (height, width, ndim) array
+                previously drawn from sampler, drawn here if not provided
         """
         super().unfreeze()
         if self.sampler is not None:
-            size = (self.size[1], self.size[0], self.ndim)
-            self._spatial_noise = 0.5 * np.tanh(self.sampler(size=size))
+            if spatial_noise is None:
+                size = (self.size[1], self.size[0], self.ndim)
+                spatial_noise = self.sampler(size=size)
+            self._spatial_noise = 0.5 * np.tanh(spatial_noise)
 
     def _update_pixel_values(self, array):
         """Draws next pixel scaling vector and creates rescaled version of
@@ -65,7 +71,8 @@ class PolygonCell(BinaryBlob):
             # Scale array channel wise
             scaled_array = array * ts_slice
             if self.sampler is not None:
-                scaled_array += array * self._spatial_noise
+                # Out of place as float32 mask and time serie would downcast noise
+                scaled_array = scaled_array + array * self._spatial_noise
             output = scaled_array
         else:
             output = self.asarray()
@@ -79,10 +86,71 @@ class PolygonCell(BinaryBlob):
         Returns:
             type: (np.ndarray, np.ndarray)
         """
-        blob_patch = super(BinaryBlob, self).__next__()
-        annotation_mask = self.annotation_mask_from(patch_array=self.asarray())
+        if self.static:
+            raise TypeError(f"{self} is not iterable, unfreeze to allow iteration")
+        mask = self._update_size()
+        blob_patch = self._update_pixel_values(mask)
+        annotation_mask = self.annotation_mask_from(patch_array=mask)
         return blob_patch, annotation_mask
 
+    def next_stack(self, n):
+        """Yields n successive updates of the blob at once, stacked along a
+        leading time axis. Equivalent to stacking n successive __next__ calls
+        outputs as cell footprint is computed only once and time serie slices
+        are broadcasted across all time steps
+
+        Args:
+            n (int): number of time steps to draw
+
+        Returns:
+            type: (np.ndarray, np.ndarray) as (n, height, width, ndim)
+                and (n, height, width, 2) arrays
+        """
+        array = self.asarray()
+        if self.time_serie is not None:
+            # Scale array channel wise at each time step
+            ts_stack = self.next_ts_stack(n)
+            blob_stack = array * ts_stack[:, None, None, :]
+            if self.sampler is not None:
+                blob_stack += array * self._spatial_noise
+        else:
+            blob_stack = np.broadcast_to(array, (n,) + array.shape)
+        # Annotation mask does not vary through time for polygon cells
+        annotation_mask = self.annotation_mask_from(patch_array=array)
+        annotation_stack = np.broadcast_to(annotation_mask, (n,) + annotation_mask.shape)
+        return blob_stack, annotation_stack
+
+    def next_ts_stack(self, n):
+        """Draws n next time serie slices at once
+
+        Args:
+            n (int): number of time steps to draw
+
+        Returns:
+            type: np.ndarray as (n, ndim) array
+        """
+        if self.static:
+            raise TypeError(f"{self} is not iterable, unfreeze to allow iteration")
+        if self.time_serie is not None:
+            ts_stack = np.stack([next(self._ts_iterator) for _ in range(n)])
+        else:
+            ts_stack = np.ones((n, self.ndim))
+        return ts_stack
+
+    def noise_patch(self):
+        """Spatial noise added to cell pixel values at each time step, zeros
+        if no sampler is defined
+
+        Returns:
+            type: np.ndarray as (height, width, ndim) array
+        """
+        array = self.asarray()
+        if self.sampler is not None:
+            noise = array * self._spatial_noise
+        else:
+            noise = np.zeros_like(array)
+        return noise
+
     @property
     def polygon(self):
         return self._polygon
@@ -194,3 +262,231 @@ class PolygonCell(BinaryBlob):
             discrete_y -= bottom_left[1]
             discrete_vertices += [(discrete_y, discrete_x)]
         return discrete_vertices
+
+
+class PolygonArrayCell:
+    """Lightweight polygon cell storing its footprint as a boolean mask array
+
+    Drop-in replacement for PolygonCell in product generation, implementing
+    the same iteration protocol but without subclassing PIL.Image.Image. Polygon
+    is rasterized once at initialization and only its mask, bounds, index, label
+    and time serie are kept, such that products with thousands of cells stay
+    light. Arrays patched at each time step are computed when unfreezing cell
+    such that iteration only rescales them with time serie values.
+
+    Augmentations operating on PIL images are not supported.
+
+    Args:
+        polygon (shapely.geometry.Polygon): cell polygon
+        product_size (tuple[int]): (height, width) of product the cell is
+            supposed to belong to
+        idx (int): cell index in product
+        time_serie (src.timeserie.TimeSerie): time serie used to update pixels
+            values within cell
+        sampler (callable): spatial noise sampler
+        threshold (int): binarization threshold in [0-255] of rasterized polygon
+    """
+    __slots__ = ('_mask', '_bounds', '_product_size', '_idx', '_label', '_time_serie',
+                 '_sampler', '_static', '_affiliated', '_ts_iterator', '_footprint',
+                 '_noise_patch', '_annotation_mask')
+
+    def __init__(self, polygon, product_size, idx=None, time_serie=None,
+                 sampler=None, threshold=100):
+        img, _ = PolygonCell._shapely_to_pil(polygon, product_size)
+        self._mask = np.asarray(img) > threshold
+        self._bounds = polygon.bounds
+        self._product_size = product_size
+        self._idx = idx
+        self._time_serie = time_serie
+        self._label = time_serie.label if time_serie is not None else None
+        self._sampler = sampler
+        self._static = True
+        self._affiliated = False
+
+    def __array__(self, dtype=None):
+        array = 255 * self.mask.astype(np.uint8)
+        return array if dtype is None else array.astype(dtype)
+
+    def get_center_loc(self):
+        """Computes center pixel location of cell for patching to product
+        Returns:
+            type: tuple[int]
+        """
+        x1, y1, x2, y2 = self.bounds
+        mean_x = 0.5 * (x1 + x2)
+        mean_y = 0.5 * (y1 + y2)
+        row, col = PolygonCell.discretize_coordinates((mean_x, mean_y), self.product_size)
+        return row, col
+
+    def asarray(self):
+        """Converts mask as a (height, width, ndim) float array valued in {0, 1}
+
+        Returns:
+            type: np.ndarray
+        """
+        return np.tile(self.mask[..., None].astype(np.float64), self.ndim)
+
+    def freeze(self):
+        """Freezes iteration over cell and drops arrays computed for iteration
+        """
+        self._static = True
+        self._footprint = self._noise_patch = self._annotation_mask = None
+
+    def unfreeze(self, spatial_noise=None):
+        """Allows to iterate over cell and computes arrays patched at each
+        time step
+
+        Args:
+            spatial_noise (np.ndarray): optional (height, width, ndim) array
+                previously drawn from sampler, drawn here if not provided
+        """
+        self._static = False
+        if self.time_serie is not None:
+            self._ts_iterator = iter(self.time_serie)
+        self._footprint = self.mask[..., None].astype(np.float64)
+        array = self.asarray()
+        if self.sampler is not None:
+            if spatial_noise is None:
+                size = (self.size[1], self.size[0], self.ndim)
+                spatial_noise = self.sampler(size=size)
+            self._noise_patch = array * (0.5 * np.tanh(spatial_noise))
+        else:
+            self._noise_patch = np.zeros_like(array)
+        self._annotation_mask = self.annotation_mask_from(patch_array=array)
+        self._annotation_mask.setflags(write=False)
+
+    def __next__(self):
+        """Yields cell pixels rescaled with next time serie values along
+        with annotation mask
+
+        Returns:
+            type: (np.ndarray, np.ndarray)
+        """
+        if self.static:
+            raise TypeError(f"{self} is not iterable, unfreeze to allow iteration")
+        if self.time_serie is not None:
+            patch = self._footprint * next(self._ts_iterator)
+            patch += self._noise_patch
+        else:
+            patch = self.asarray()
+        return patch, self._annotation_mask
+
+    def next_stack(self, n):
+        """Yields n successive updates of the cell at once, stacked along a
+        leading time axis - see PolygonCell.next_stack
+
+        Args:
+            n (int): number of time steps to draw
+
+        Returns:
+            type: (np.ndarray, np.ndarray) as (n, height, width, ndim)
+                and (n, height, width, 2) arrays
+        """
+        if self.time_serie is not None:
+            ts_stack = self.next_ts_stack(n)
+            blob_stack = self._footprint * ts_stack[:, None, None, :]
+            blob_stack += self._noise_patch
+        else:
+            array = self.asarray()
+            blob_stack = np.broadcast_to(array, (n,) + array.shape)
+        annotation_stack = np.broadcast_to(self._annotation_mask, (n,) + self._annotation_mask.shape)
+        return blob_stack, annotation_stack
+
+    def next_ts_stack(self, n):
+        """Draws n next time serie slices at once
+
+        Args:
+            n (int): number of time steps to draw
+
+        Returns:
+            type: np.ndarray as (n, ndim) array
+        """
+        if self.static:
+            raise TypeError(f"{self} is not iterable, unfreeze to allow iteration")
+        if self.time_serie is not None:
+            ts_stack = np.stack([next(self._ts_iterator) for _ in range(n)])
+        else:
+            ts_stack = np.ones((n, self.ndim))
+        return ts_stack
+
+    def noise_patch(self):
+        """Spatial noise added to cell pixel values at each time step
+
+        Returns:
+            type: np.ndarray as (height, width, ndim) array
+        """
+        return self._noise_patch
+
+    def annotation_mask_from(self, patch_array):
+        """Builds annotation mask out of array to be patched - see
+        BinaryBlob.annotation_mask_from
+
+        Args:
+            patch_array (np.darray)
+
+        Returns:
+            type: np.darray
+        """
+        base_mask = (patch_array.sum(axis=-1, keepdims=True) > 0).astype(int)
+        mask = self.idx * base_mask
+        if self.time_serie is not None:
+            ts_mask = self.label * base_mask
+            mask = np.dstack([mask, ts_mask])
+        return mask
+
+    def set_idx(self, idx):
+        self._idx = idx
+
+    def affiliate(self):
+        self._affiliated = True
+
+    @property
+    def mask(self):
+        return self._mask
+
+    @property
+    def bounds(self):
+        return self._bounds
+
+    @property
+    def size(self):
+        return self.mask.shape[1], self.mask.shape[0]
+
+    @property
+    def product_size(self):
+        return self._product_size
+
+    @property
+    def idx(self):
+        return self._idx
+
+    @property
+    def label(self):
+        return self._label
+
+    @property
+    def time_serie(self):
+        return self._time_serie
+
+    @property
+    def sampler(self):
+        return self._sampler
+
+    @property
+    def scale_sampler(self):
+        return None
+
+    @property
+    def static(self):
+        return self._static
+
+    @property
+    def affiliated(self):
+        return self._affiliated
+
+    @property
+    def ndim(self):
+        if self.time_serie:
+            return self.time_serie.ndim
+        else:
+            return 1
@@ -1,7 +1,9 @@
+from itertools import tee, zip_longest
 import numpy as np
 from skimage.measure import block_reduce
 from progress.bar import Bar
-from .product import ProductExport
+from .export import make_export
+from .modules import separable_block_reduce
 from src.utils import setseed
 
 
@@ -12,8 +14,8 @@ class Degrader:
         > Applies geometric and corruption transformation to images (typically perspective)
         > Downsamples by blocks aggregation
 
-    Currently, blocks are designed to not intersect such that only fractions of input
-    image size can be set as target size. To be solved adding padding or stride.
+    Blocks are designed to not intersect, input images are hence padded or cropped
+    to the closest multiple of target size before downsampling.
 
     Args:
         size (tuple[int]): target (width, height) fo degraded product
@@ -36,10 +38,12 @@ class Degrader:
 
     def _new_index_from(self, index):
         new_index = index.copy()
+        new_index['features'] = index['features'].copy()
         new_index['features']['width'] = self.size[0]
         new_index['features']['height'] = self.size[1]
         new_index['features']['nframes'] = 0
         new_index['files'] = {}
+        new_index.pop('layout', None)
         return new_index
 
     @setseed('numpy')
@@ -92,6 +96,12 @@ class Degrader:
 
     def downsample(self, img):
         """Runs image downsampling with custom aggregation function
+
+        Image is first padded or cropped such that its dimensions are exactly
+        multiples of target size. If aggregation function is a convolution with
+        separable kernel - e.g. heat kernel - blocks are aggregated through
+        separable strided convolution, else with skimage block_reduce
+
         Args:
             img (np.ndarray)
         Returns:
@@ -99,36 +109,48 @@ class Degrader:
         """
         if self.aggregate_fn is not None:
             # Compute aggregation blocks dimensions
-            width, height, _ = img.shape
-            block_width = width // self.size[0]
+            height, width, _ = img.shape
             block_height = height // self.size[1]
-            block_size = (block_width, block_height, 1)
+            block_width = width // self.size[0]
+            block_size = (block_height, block_width, 1)
+            img = self._adjust_with_padding(img=img, block_size=block_size)
             # Apply downsampling
-            img = block_reduce(image=img, block_size=block_size, func=self.aggregate_fn)
+            factors = getattr(self.aggregate_fn, 'factors', None)
+            if factors is not None and tuple(map(len, factors)) == block_size[:2]:
+                img = separable_block_reduce(img=img, factors=factors)
+            else:
+                img = block_reduce(image=img, block_size=block_size, func=self.aggregate_fn)
         return img
 
     def _adjust_with_padding(self, img, block_size):
-        """Pads image such that dimensions are a multiple of the block size
+        """Pads or crops image such that dimensions are exactly target size
+        times block size. Padding and cropping are centered.
         When downsampling, blocks must not overlap as each represent a
         ground resolution cell
 
         Args:
             img (np.ndarray): image to downsample
-            block_size (tuple[int]): (block_width, block_height, 1)
+            block_size (tuple[int]): (block_height, block_width, 1)
 
         Returns:
             type: np.ndarray
         """
         # Compute leftover pixels when viewing with this blocksize
-        width_excess = block_size[0] * self.size[0] - img.shape[0]
-        height_excess = block_size[0] * self.size[0] - img.shape[1]
-
-        # Pad image to get dimensions multiple of block size
-        wpad = (width_excess // 2, width_excess // 2 + width_excess % 2)
-        hpad = (height_excess // 2, height_excess // 2 + height_excess % 2)
-        padded_x = np.pad(img, pad_width=(wpad, hpad, (0, 0)))
-
-        return padded_x
+        height_excess = block_size[0] * self.size[1] - img.shape[0]
+        width_excess = block_size[1] * self.size[0] - img.shape[1]
+
+        # Crop image if larger than blocks grid
+        top, left = max(0, -height_excess) // 2, max(0, -width_excess) // 2
+        img = img[top:top + img.shape[0] + min(0, height_excess),
+                  left:left + img.shape[1] + min(0, width_excess)]
+
+        # Pad image if smaller than blocks grid
+        height_excess, width_excess = max(0, height_excess), max(0, width_excess)
+        if height_excess or width_excess:
+            hpad = (height_excess // 2, height_excess // 2 + height_excess % 2)
+            wpad = (width_excess // 2, width_excess // 2 + width_excess % 2)
+            img = np.pad(img, pad_width=(hpad, wpad, (0, 0)))
+        return img
 
     def transform_annotation(self, annotation):
         """Applies geometric and downsampling transforms to annotation mask
@@ -162,7 +184,7 @@ class Degrader:
         img = self.apply_postprocess_transform(img, seed=seed)
         return img
 
-    def derive(self, product_set, output_dir):
+    def derive(self, product_set, output_dir, astype='h5', compression=None, batch_size=None):
         """Iterates over product dataset, applies degradation transformation
             and dumps resulting images
 
@@ -170,22 +192,172 @@ class Degrader:
             product_set (ProductDataset): instance of product dataset typically
                 previously generate with Product class
             output_dir (str): path to output directory
+            astype (str): export type in {'h5', 'container', 'memmap'}
+            compression (str): datasets compression for container export
+            batch_size (int): if specified, frames are loaded, degraded and
+                dumped by stacks of batch_size frames - see self.derive_stack
+        """
+        if batch_size:
+            self._derive_by_stacks(product_set=product_set,
+                                   output_dir=output_dir,
+                                   astype=astype,
+                                   compression=compression,
+                                   batch_size=batch_size)
+        else:
+            bar = Bar("Derivation", max=len(product_set))
+            frames = (product_set[i] for i in range(len(product_set)))
+            derived_frames = self.stream(frames=frames,
+                                         index=product_set.index,
+                                         output_dir=output_dir,
+                                         astype=astype,
+                                         compression=compression)
+            for _ in derived_frames:
+                bar.next()
+
+    def _derive_by_stacks(self, product_set, output_dir, astype, compression, batch_size):
+        """Derives product by stacks of frames such that each degradation
+        stage and export is run once per stack
+
+        Args:
+            product_set (ProductDataset): instance of product dataset typically
+                previously generate with Product class
+            output_dir (str): path to output directory
+            astype (str): export type in {'h5', 'container', 'memmap'}
+            compression (str): datasets compression for container export
+            batch_size (int): number of frames per stack
         """
         # Setup export
-        export = ProductExport(output_dir, astype='h5')
+        export = make_export(output_dir, astype, compression=compression)
         export._setup_output_dir()
         bar = Bar("Derivation", max=len(product_set))
 
-        # Build new index from dataset's one
+        # Build new index from dataset's one, with all steps skipped by default
         index = self._new_index_from(product_set.index)
+        index['files'] = {i: None for i in range(len(product_set))}
         export.set_index(index)
 
-        for i in range(len(product_set)):
-            # Retrieve image from dataset
-            img, annotation = product_set[i]
+        # Keep steps matching temporal resolution
+        time_steps = [i for i in range(len(product_set))
+                      if i % self.temporal_res == 0 and product_set._frames_path[i] is not None]
+
+        for start in range(0, len(time_steps), batch_size):
+            idx = time_steps[start:start + batch_size]
+
+            # Load and degrade stacks of images and annotations
+            imgs, annotations = product_set.get_stack(idx)
+            imgs = self.derive_stack(imgs=imgs)
+            annotations = self.transform_annotation_stack(annotations=annotations)
+
+            # Record new frames in index and dump stacks
+            frames_names = [f"frame_{i}.h5" for i in idx]
+            annotations_names = [f"annotation_{i}.h5" for i in idx]
+            index['features']['nframes'] += len(idx)
+            export.dump_stack(idx, imgs, annotations, frames_names, annotations_names)
+            bar.next(len(idx))
+        export.dump_index(index=index)
+
+    def derive_stack(self, imgs):
+        """Applies class defined image alteration to a stack of images at once :
+            - Corruption transformation as a batch of images
+            - Geometric transformation and downsampling of the stack - see
+                self.warp_and_downsample_stack
+            - Postprocessing transformation as a batch of images
+
+        Args:
+            imgs (np.ndarray): (n_frames, height, width, nbands) stack
+
+        Returns:
+            type: np.ndarray
+        """
+        if self.corruption_transform:
+            imgs = np.stack(self.corruption_transform(images=imgs))
+        imgs = self.warp_and_downsample_stack(imgs=imgs)
+        if self.postprocess_transform:
+            imgs = np.stack(self.postprocess_transform(images=imgs))
+        return imgs
+
+    def transform_annotation_stack(self, annotations):
+        """Applies geometric and downsampling transforms to a stack of
+        annotation masks at once - see self.transform_annotation
+
+        Args:
+            annotations (np.ndarray): (n_frames, height, width, annotation_bands) stack
+
+        Returns:
+            type: np.ndarray
+        """
+        annotations = self.warp_and_downsample_stack(imgs=annotations.astype(np.float32))
+        return annotations.astype(np.int16)
+
+    def warp_and_downsample_stack(self, imgs):
+        """Applies geometric transformation and downsampling to a stack of images
+
+        Images are stacked along channels such that blocks reduction is computed
+        once for the whole stack. If geometric transform is deterministic, that
+        is always applies the same warp as TangentialScaleDistortion, warping is
+        also computed once for the stack. Random geometric transforms are
+        otherwise applied frame by frame for each frame to get its own random
+        draw as when deriving frames one by one.
+
+        Args:
+            imgs (np.ndarray): (n_frames, height, width, channels) stack
+
+        Returns:
+            type: np.ndarray
+        """
+        if self.geometric_transform and not getattr(self.geometric_transform, 'deterministic', False):
+            imgs = np.stack([self.apply_geometric_transform(img=img) for img in imgs])
+            img = self._stack_along_channels(imgs)
+        else:
+            img = self._stack_along_channels(imgs)
+            img = self.apply_geometric_transform(img=img)
+        img = self.downsample(img=img)
+        return self._unstack_from_channels(img, n_frames=len(imgs))
+
+    @staticmethod
+    def _stack_along_channels(imgs):
+        """(n_frames, height, width, channels) -> (height, width, n_frames * channels)
+        """
+        n_frames, height, width, channels = imgs.shape
+        return imgs.transpose(1, 2, 0, 3).reshape(height, width, n_frames * channels)
+
+    @staticmethod
+    def _unstack_from_channels(img, n_frames):
+        """(height, width, n_frames * channels) -> (n_frames, height, width, channels)
+        """
+        height, width, channels = img.shape
+        return img.reshape(height, width, n_frames, channels // n_frames).transpose(2, 0, 1, 3)
+
+    def stream(self, frames, index, output_dir, astype='h5', compression=None):
+        """Consumes iterator over frames and annotations, applies degradation
+            transformation and dumps resulting images
+
+        Derived frames and annotations are yielded along - None if time step
+            is skipped - such that they can be consumed by another degrader
+            without being read back from disk. Index is dumped once frames
+            iterator is exhausted
 
+        Args:
+            frames (iterator): iterator over (frame, annotation) tuples
+            index (dict): index of product frames are drawn from
+            output_dir (str): path to output directory
+            astype (str): export type in {'h5', 'container', 'memmap'}
+            compression (str): datasets compression for container export
+
+        Yields:
+            type: (np.ndarray, np.ndarray)
+        """
+        # Setup export
+        export = make_export(output_dir, astype, compression=compression)
+        export._setup_output_dir()
+
+        # Build new index from source product's one
+        index = self._new_index_from(index)
+        export.set_index(index)
+
+        for i, (img, annotation) in enumerate(frames):
             # If step matches temporal resolution
-            if i % self.temporal_res == 0:
+            if i % self.temporal_res == 0 and img is not None:
                 # Degrade image and annotation
                 img = self(img=img)
                 annotation = self.transform_annotation(annotation=annotation)
@@ -199,10 +371,11 @@ class Degrader:
                 # Dump degraded frame and annotation mask
                 export.dump_frame(img, frame_name)
                 export.dump_annotation(annotation, annotation_name)
+                yield img, annotation
             else:
                 # Else skip image
                 index['files'][i] = None
-            bar.next()
+                yield None, None
         export.dump_index(index=index)
 
     @property
@@ -228,3 +401,60 @@ class Degrader:
     @property
     def aggregate_fn(self):
         return self._aggregate_fn
+
+
+def derive_stream(frames, index, derivations):
+    """Derives several products in a single pass over a stream of frames, such
+    that only derived products are ever dumped.
+
+    Each derivation either consumes the input stream or the stream of derived
+    frames of another derivation, e.g. for derivations with sources
+    {'clean': None, 'clouded': 'clean', 'sar': None} :
+    ```
+    frames ─┬─> clean ──> clouded
+            └─> sar
+    ```
+
+    Args:
+        frames (iterator): iterator over (frame, annotation) tuples, typically
+            Product.stream()
+        index (dict): index of product frames are drawn from, typically
+            ProductExport.generation_index_of(product)
+        derivations (dict): {name: specification} where each specification is
+            a dictionnary with keys :
+                - 'degrader' (Degrader): degrader to derive product with
+                - 'output_dir' (str): path to derived product output directory
+                - 'source' (str): name of derivation to derive from, None for
+                    input stream. Must be listed before derivations consuming it
+                - 'astype' (str): optional export type (default: 'h5')
+                - 'compression' (str): optional container datasets compression
+    """
+    # Count consumers of each stream to split it accordingly
+    n_consumers = {None: 0}
+    for name, specs in derivations.items():
+        if specs['source'] not in n_consumers:
+            raise ValueError(f"Unknown source {specs['source']} for {name}, sources must be listed before derivations consuming them")
+        n_consumers[specs['source']] += 1
+        n_consumers[name] = 0
+
+    # Chain degraders streams, each stream being split among its consumers
+    streams = {None: list(tee(frames, n_consumers[None]))}
+    indices = {None: index}
+    leaves = []
+    for name, specs in derivations.items():
+        degrader, source = specs['degrader'], specs['source']
+        derived_frames = degrader.stream(frames=streams[source].pop(),
+                                         index=indices[source],
+                                         output_dir=specs['output_dir'],
+                                         astype=specs.get('astype', 'h5'),
+                                         compression=specs.get('compression'))
+        indices[name] = degrader._new_index_from(indices[source])
+        if n_consumers[name] > 0:
+            streams[name] = list(tee(derived_frames, n_consumers[name]))
+        else:
+            leaves.append(derived_frames)
+
+    # Pull frames through all derivations in lockstep until every stream is exhausted
+    bar = Bar("Derivation", max=index['features']['horizon'])
+    for _ in zip_longest(*leaves):
+        bar.next()
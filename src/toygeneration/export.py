@@ -1,4 +1,7 @@
 import os
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import h5py
 import numpy as np
 from PIL import Image
@@ -6,6 +9,26 @@ from torch.utils.data import Dataset
 from src.utils import mkdir, save_json, load_json
 
 
+def make_export(output_dir, astype, compression=None):
+    """Instantiates product export handler adapted to export type
+
+    Args:
+        output_dir (str): output directory
+        astype (str): export type in {'h5', 'jpg', 'container', 'memmap'}
+        compression (str): container datasets compression in {None, 'lzf', 'gzip'}
+
+    Returns:
+        type: ProductExport
+    """
+    if astype == 'container':
+        export = ProductContainerExport(output_dir, compression=compression)
+    elif astype == 'memmap':
+        export = ProductMemmapExport(output_dir)
+    else:
+        export = ProductExport(output_dir, astype)
+    return export
+
+
 class ProductExport:
     """Handler for product image dumping during generation or derivation step
 
@@ -24,7 +47,8 @@ class ProductExport:
 
     Args:
         output_dir (str): output directory
-        astype (str): export type in {'h5', 'jpg'}
+        astype (str): export type in {'h5', 'jpg'}, see ProductContainerExport
+            and ProductMemmapExport for single file exports
     """
     _frame_dirname = 'frames/'
     _annotation_dirname = 'annotations/'
@@ -69,6 +93,15 @@ class ProductExport:
     def _init_generation_index(self, product):
         """Initializes generation index as described above (this is the
         to be `index.json`)
+        """
+        self._index = self.generation_index_of(product)
+
+    @staticmethod
+    def generation_index_of(product):
+        """Builds empty generation index of product
+
+        Args:
+            product (Product)
 
         Returns:
             type: dict
@@ -80,7 +113,7 @@ class ProductExport:
                               'ndigit': len(product),
                               'nframes': 0},
                  'files': dict()}
-        self._index = index
+        return index
 
     def add_to_index(self, idx, frame_name, annotation_name):
         """Records files paths into generation index to create unique mapping
@@ -153,6 +186,21 @@ class ProductExport:
         dump_path = os.path.join(self.output_dir, self._annotation_dirname, filename)
         self.dump_array(array=annotation, dump_path=dump_path)
 
+    def dump_stack(self, idx, frames, annotations, frame_names, annotation_names):
+        """Records into index and dumps stacks of frames and annotation masks
+
+        Args:
+            idx (list[int]): keys mapping to each frame and respective annotation
+            frames (np.ndarray): (n_frames, height, width, nbands) stack
+            annotations (np.ndarray): (n_frames, height, width, annotation_bands) stack
+            frame_names (list[str])
+            annotation_names (list[str])
+        """
+        for i, frame, annotation, frame_name, annotation_name in zip(idx, frames, annotations, frame_names, annotation_names):
+            self.add_to_index(i, frame_name, annotation_name)
+            self.dump_frame(frame, frame_name)
+            self.dump_annotation(annotation, annotation_name)
+
     def dump_index(self, index=None):
         """Simply saves index as json file under export directory
 
@@ -176,19 +224,403 @@ class ProductExport:
         return self._astype
 
 
+class ProductContainerExport(ProductExport):
+    """Handler for product dumping into a single hdf5 container file
+
+    Sets up an output directory structured as :
+    ```
+    directory_name/
+    └── product.h5
+        ├── frames
+        ├── annotations
+        └── attrs['index']
+    ```
+    where:
+        - `frames`: (n_frames, height, width, nbands) dataset of imagery frames
+        - `annotations`: (n_frames, height, width, annotation_bands) dataset of
+        frames mask annotations
+        - `attrs['index']`: same as `index.json` for directory export, with
+        frames and annotations positions in datasets instead of paths
+
+    Datasets are chunked by frame such that single frames can be read by slicing
+
+    Args:
+        output_dir (str): output directory
+        compression (str): datasets compression in {None, 'lzf', 'gzip'}
+    """
+    _container_name = 'product.h5'
+    _frame_dataset_name = 'frames'
+    _annotation_dataset_name = 'annotations'
+    _index_attribute_name = 'index'
+    __frames_export_types__ = {'container'}
+    __compression_types__ = {None, 'lzf', 'gzip'}
+
+    def __init__(self, output_dir, compression=None):
+        super().__init__(output_dir=output_dir, astype='container')
+        if compression not in self.__compression_types__:
+            raise TypeError("Unknown compression type")
+        self._compression = compression
+
+    def _setup_output_dir(self, output_dir=None, overwrite=False):
+        """Builds output directory and opens container file
+
+        Args:
+            output_dir (str): path to output directory
+            overwrite (bool): if True and directory already exists, erases
+                everything and recreates from scratch
+        """
+        output_dir = output_dir or self.output_dir
+        mkdir(output_dir, overwrite=overwrite)
+        self._file = h5py.File(os.path.join(output_dir, self._container_name), 'w')
+
+    def add_to_index(self, idx, frame_name, annotation_name):
+        """Records frame position in container datasets into generation index
+        to create unique mapping of frames and corresponding annotations by
+        time step. Frame and annotation names are ignored
+
+        Args:
+            idx (int): key mapping to frame and respective annotation positions
+            frame_name (str)
+            annotation_name (str)
+        """
+        position = self._get_length(self._frame_dataset_name)
+        self._index['files'][idx] = {'frame': position,
+                                     'annotation': position}
+        self._index['features']['nframes'] += 1
+
+    def _get_length(self, name):
+        """Number of arrays already dumped in container dataset
+
+        Args:
+            name (str): dataset name
+
+        Returns:
+            type: int
+        """
+        if name in self._file:
+            length = len(self._file[name])
+        else:
+            length = 0
+        return length
+
+    def dump_array(self, array, name):
+        """Appends numpy array to container dataset, creating the dataset
+        chunked by array if it does not exist yet
+
+        Args:
+            array (np.ndarray)
+            name (str): dataset name
+        """
+        self.dump_arrays(arrays=array[None], name=name)
+
+    def dump_arrays(self, arrays, name):
+        """Appends stack of numpy arrays to container dataset in a single write,
+        creating the dataset chunked by array if it does not exist yet
+
+        Args:
+            arrays (np.ndarray): (n_arrays, *array_shape) stack
+            name (str): dataset name
+        """
+        array_shape = arrays.shape[1:]
+        if name not in self._file:
+            self._file.create_dataset(name=name,
+                                      shape=(0,) + array_shape,
+                                      maxshape=(None,) + array_shape,
+                                      chunks=(1,) + array_shape,
+                                      dtype=arrays.dtype,
+                                      compression=self.compression)
+        dataset = self._file[name]
+        dataset.resize(len(dataset) + len(arrays), axis=0)
+        dataset[-len(arrays):] = arrays
+
+    def dump_frame(self, frame, filename=None, astype=None):
+        """Appends numpy array of imagery frame to container frames dataset
+
+        Args:
+            frame (np.ndarray): array to dump
+            filename (str): unused, kept for compatibility
+            astype (str): unused, kept for compatibility
+        """
+        self.dump_array(array=frame, name=self._frame_dataset_name)
+
+    def dump_annotation(self, annotation, filename=None):
+        """Appends annotation mask to container annotations dataset
+
+        Args:
+            annotation (np.ndarray): array to dump
+            filename (str): unused, kept for compatibility
+        """
+        self.dump_array(array=annotation, name=self._annotation_dataset_name)
+
+    def dump_stack(self, idx, frames, annotations, frame_names=None, annotation_names=None):
+        """Records into index and appends stacks of frames and annotation masks
+        to container datasets in a single write each
+
+        Args:
+            idx (list[int]): keys mapping to each frame and respective annotation
+            frames (np.ndarray): (n_frames, height, width, nbands) stack
+            annotations (np.ndarray): (n_frames, height, width, annotation_bands) stack
+            frame_names (list[str]): unused, kept for compatibility
+            annotation_names (list[str]): unused, kept for compatibility
+        """
+        position = self._get_length(self._frame_dataset_name)
+        for k, i in enumerate(idx):
+            self._index['files'][i] = {'frame': position + k,
+                                       'annotation': position + k}
+            self._index['features']['nframes'] += 1
+        self.dump_arrays(arrays=frames, name=self._frame_dataset_name)
+        self.dump_arrays(arrays=annotations, name=self._annotation_dataset_name)
+
+    def dump_index(self, index=None):
+        """Saves index as json string attribute of container and closes it
+
+        Args:
+            index (dict): dictionnary to dump as json (default: self.index)
+        """
+        if hasattr(self, '_index') and index is None:
+            index = self._index
+        self._file.attrs[self._index_attribute_name] = json.dumps(index)
+        self._file.close()
+
+    @property
+    def compression(self):
+        return self._compression
+
+
+class ProductMemmapExport(ProductExport):
+    """Handler for product dumping as raw contiguous arrays files meant to be
+    memory-mapped at loading
+
+    Sets up an output directory structured as :
+    ```
+    directory_name/
+    ├── frames.raw
+    ├── annotations.raw
+    └── index.json
+    ```
+    where:
+        - `frames.raw`: (n_frames, nbands, height, width) float32 channels-first
+        imagery frames
+        - `annotations.raw`: (n_frames, height, width, annotation_bands) int16
+        mask annotations
+        - `index.json`: same as for directory export, with frames and annotations
+        positions in raw arrays instead of paths. Arrays filename, dtype and
+        shape are recorded under 'layout' key
+
+    Args:
+        output_dir (str): output directory
+    """
+    _frame_filename = 'frames.raw'
+    _annotation_filename = 'annotations.raw'
+    __frames_export_types__ = {'memmap'}
+
+    def __init__(self, output_dir):
+        super().__init__(output_dir=output_dir, astype='memmap')
+        self._layout = dict()
+
+    def _setup_output_dir(self, output_dir=None, overwrite=False):
+        """Builds output directory and opens raw arrays files
+
+        Args:
+            output_dir (str): path to output directory
+            overwrite (bool): if True and directory already exists, erases
+                everything and recreates from scratch
+        """
+        output_dir = output_dir or self.output_dir
+        mkdir(output_dir, overwrite=overwrite)
+        self._files = {'frames': open(os.path.join(output_dir, self._frame_filename), 'wb'),
+                       'annotations': open(os.path.join(output_dir, self._annotation_filename), 'wb')}
+        self._n_frames = 0
+
+    def add_to_index(self, idx, frame_name, annotation_name):
+        """Records frame position in raw arrays into generation index to create
+        unique mapping of frames and corresponding annotations by time step.
+        Frame and annotation names are ignored
+
+        Args:
+            idx (int): key mapping to frame and respective annotation positions
+            frame_name (str)
+            annotation_name (str)
+        """
+        self._index['files'][idx] = {'frame': self._n_frames,
+                                     'annotation': self._n_frames}
+        self._index['features']['nframes'] += 1
+
+    def dump_array(self, array, name, channels_first=False):
+        """Appends numpy array bytes to raw file and records its layout
+
+        Args:
+            array (np.ndarray)
+            name (str): in {'frames', 'annotations'}
+            channels_first (bool): if True, records array as channels-first
+        """
+        self.dump_arrays(arrays=array[None], name=name, channels_first=channels_first)
+
+    def dump_arrays(self, arrays, name, channels_first=False):
+        """Appends stack of numpy arrays bytes to raw file in a single write and
+        records arrays layout
+
+        Args:
+            arrays (np.ndarray): (n_arrays, *array_shape) stack
+            name (str): in {'frames', 'annotations'}
+            channels_first (bool): if True, records arrays as channels-first
+        """
+        self._layout[name] = {'filename': os.path.basename(self._files[name].name),
+                              'dtype': arrays.dtype.str,
+                              'shape': list(arrays.shape[1:]),
+                              'channels_first': channels_first}
+        arrays.tofile(self._files[name])
+
+    def dump_frame(self, frame, filename=None, astype=None):
+        """Appends (height, width, nbands) imagery frame as channels-first float32
+        array to frames raw file
+
+        Args:
+            frame (np.ndarray): array to dump
+            filename (str): unused, kept for compatibility
+            astype (str): unused, kept for compatibility
+        """
+        frame = np.ascontiguousarray(frame.transpose(2, 0, 1), dtype=np.float32)
+        self.dump_array(array=frame, name='frames', channels_first=True)
+        self._n_frames += 1
+
+    def dump_annotation(self, annotation, filename=None):
+        """Appends annotation mask to annotations raw file
+
+        Args:
+            annotation (np.ndarray): array to dump
+            filename (str): unused, kept for compatibility
+        """
+        annotation = np.ascontiguousarray(annotation, dtype=np.int16)
+        self.dump_array(array=annotation, name='annotations')
+
+    def dump_stack(self, idx, frames, annotations, frame_names=None, annotation_names=None):
+        """Records into index and appends stacks of frames and annotation masks
+        to raw files in a single write each
+
+        Args:
+            idx (list[int]): keys mapping to each frame and respective annotation
+            frames (np.ndarray): (n_frames, height, width, nbands) stack
+            annotations (np.ndarray): (n_frames, height, width, annotation_bands) stack
+            frame_names (list[str]): unused, kept for compatibility
+            annotation_names (list[str]): unused, kept for compatibility
+        """
+        for i in idx:
+            self.add_to_index(i, None, None)
+            self._n_frames += 1
+        frames = np.ascontiguousarray(frames.transpose(0, 3, 1, 2), dtype=np.float32)
+        annotations = np.ascontiguousarray(annotations, dtype=np.int16)
+        self.dump_arrays(arrays=frames, name='frames', channels_first=True)
+        self.dump_arrays(arrays=annotations, name='annotations')
+
+    def dump_index(self, index=None):
+        """Closes raw files and saves index along with arrays layout as json
+        file under export directory
+
+        Args:
+            index (dict): dictionnary to dump as json (default: self.index)
+        """
+        for f in self._files.values():
+            f.close()
+        if hasattr(self, '_index') and index is None:
+            index = self._index
+        index['layout'] = self._layout
+        super().dump_index(index=index)
+
+
+class H5HandlePool:
+    """Bounded pool of read-only h5py file handles, least recently used handles
+    being closed first when pool is full
+
+    Handles are kept open in between accesses to avoid paying file opening and
+    hdf5 metadata parsing at each read. Since h5py handles must not be shared
+    across processes, pool is emptied whenever accessed from a new process - e.g.
+    a DataLoader worker - such that each worker reopens its own handles
+
+    Args:
+        maxsize (int): maximum number of simultaneously open handles
+    """
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._handles = OrderedDict()
+        self._pid = os.getpid()
+
+    def __getitem__(self, path):
+        """Retrieves open handle on file, opening it if not in pool
+
+        Args:
+            path (str): path to hdf5 file
+
+        Returns:
+            type: h5py.File
+        """
+        self._reset_if_forked()
+        if path in self._handles:
+            self._handles.move_to_end(path)
+        else:
+            self._handles[path] = h5py.File(path, 'r')
+            if len(self._handles) > self.maxsize:
+                _, handle = self._handles.popitem(last=False)
+                handle.close()
+        return self._handles[path]
+
+    def _reset_if_forked(self):
+        """Drops handles inherited from parent process without closing them
+        as they are still used by parent
+        """
+        if os.getpid() != self._pid:
+            self._handles = OrderedDict()
+            self._pid = os.getpid()
+
+    def close(self):
+        """Closes all open handles of current process
+        """
+        self._reset_if_forked()
+        while self._handles:
+            _, handle = self._handles.popitem()
+            handle.close()
+
+    def __len__(self):
+        return len(self._handles)
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize):
+        self._maxsize = maxsize
+        while len(self._handles) > maxsize:
+            _, handle = self._handles.popitem(last=False)
+            handle.close()
+
+
 class ProductDataset(Dataset):
     """Dataset loading class for generated products
 
     Very straigthforward implementation to be adapted to product dumping
-        format
+        format. Handles both directory and single container file exports
+
+    Files are read through a pool of open handles shared by all product datasets
+    of a same process, see H5HandlePool. Handles are only reused across epochs
+    if pool can hold all read files, which is typically the case of container
+    exports, holding one file per product, but not of directory exports, holding
+    two files per frame. Pool size can be set with set_max_open_files. Raw arrays
+    exports are rather read as memory-mapped views such that frames can be
+    wrapped in tensors without copy
 
     Args:
         root (str): path to directory where product has been dumped
     """
+    _handles_pool = H5HandlePool(maxsize=128)
+
     def __init__(self, root, frame_transform=None, annotation_transform=None):
         self._root = root
-        index_path = os.path.join(root, ProductExport._index_name)
-        self._index = load_json(index_path)
+        self._container_path = os.path.join(root, ProductContainerExport._container_name)
+        self._is_container = os.path.isfile(self._container_path)
+        self._is_memmap = os.path.isfile(os.path.join(root, ProductMemmapExport._frame_filename))
+        self._memmaps = dict()
+        self._index = self._load_index()
         self._frames_path = self._get_paths(file_type='frame')
         self._annotations_path = self._get_paths(file_type='annotation')
         self.frame_transform = frame_transform
@@ -231,44 +663,129 @@ class ProductDataset(Dataset):
         annotation_path = self._annotations_path[idx]
 
         # Load numpy arrays from h5 files
-        frame = self._load_array(path=frame_path)
-        annotation = self._load_array(path=annotation_path)
+        frame = self._load_array(path=frame_path,
+                                 name=ProductContainerExport._frame_dataset_name)
+        annotation = self._load_array(path=annotation_path,
+                                      name=ProductContainerExport._annotation_dataset_name)
 
         # If defined, apply transformation to arrays
         frame = self._apply_frame_transform(frame)
         annotation = self._apply_annotation_transform(annotation)
         return frame, annotation
 
-    def _load_array(self, path):
+    def get_stack(self, indices):
+        """Loads frames and annotations arrays at specified indices as stacks
+        Contiguous frames of container and raw arrays exports are read at once
+
+        Args:
+            indices (list[int]): dataset indices - correspond to time steps
+
+        Returns:
+            type: (np.ndarray, np.ndarray) as (n_frames, height, width, nbands)
+                and (n_frames, height, width, annotation_bands) arrays
+        """
+        positions = [self._frames_path[idx] for idx in indices]
+        if (self.is_container or self.is_memmap) and self._is_contiguous(positions):
+            # Read frames and annotations stacks by slicing
+            stack = slice(positions[0], positions[0] + len(positions))
+            frames = self._load_array(path=stack, name=ProductContainerExport._frame_dataset_name)
+            annotations = self._load_array(path=stack, name=ProductContainerExport._annotation_dataset_name)
+            frames = np.stack([self._apply_frame_transform(frame) for frame in frames])
+            annotations = np.stack([self._apply_annotation_transform(annotation) for annotation in annotations])
+        else:
+            frames, annotations = zip(*[self[idx] for idx in indices])
+            frames, annotations = np.stack(frames), np.stack(annotations)
+        return frames, annotations
+
+    @staticmethod
+    def _is_contiguous(positions):
+        if None in positions:
+            return False
+        return positions == list(range(positions[0], positions[0] + len(positions)))
+
+    def _load_index(self):
+        """Loads product index from index.json or from container attributes
+
+        Returns:
+            type: dict
+        """
+        if self.is_container:
+            with h5py.File(self._container_path, 'r') as f:
+                index = json.loads(f.attrs[ProductContainerExport._index_attribute_name])
+        else:
+            index_path = os.path.join(self.root, ProductExport._index_name)
+            index = load_json(index_path)
+        return index
+
+    def _load_array(self, path, name=None):
         """h5py loading protocol, if null path returns None
 
         Args:
-            path (str): path to array to load
+            path (str, int, slice): path to array to load or position of
+                array - or slice of positions - in container dataset
+            name (str): container dataset name
 
         Returns:
             type: np.ndarray
         """
-        if path:
-            with h5py.File(path, 'r') as f:
-                array = f['data'][:]
-        else:
+        if path is None:
             array = None
+        elif self.is_container:
+            array = self._handles_pool[self._container_path][name][path]
+        elif self.is_memmap:
+            array = self._get_memmap(name)[path]
+            if self.index['layout'][name]['channels_first']:
+                array = np.moveaxis(array, -3, -1)
+        else:
+            array = self._handles_pool[path]['data'][:]
         return array
 
+    def _get_memmap(self, name):
+        """Lazily memory-maps raw array file in copy-on-write mode such that
+        loaded arrays are writable without altering file
+
+        Args:
+            name (str): in {'frames', 'annotations'}
+
+        Returns:
+            type: np.memmap
+        """
+        if name not in self._memmaps:
+            # Infer number of arrays from file size and recorded arrays layout
+            layout = self.index['layout'][name]
+            path = os.path.join(self.root, layout['filename'])
+            dtype = np.dtype(layout['dtype'])
+            n_arrays = os.path.getsize(path) // (dtype.itemsize * np.prod(layout['shape']))
+            self._memmaps[name] = np.memmap(filename=path,
+                                            dtype=dtype,
+                                            mode='c',
+                                            shape=(n_arrays,) + tuple(layout['shape']))
+        return self._memmaps[name]
+
+    def __getstate__(self):
+        """Drops memory-mapped arrays when pickling - e.g. for DataLoader workers
+        spawning - as they would otherwise be serialized as full arrays
+        """
+        state = self.__dict__.copy()
+        state['_memmaps'] = dict()
+        return state
+
     def _get_paths(self, file_type):
-        """Computes paths to frames and annotations. If non existing, fills
-        with None
+        """Computes paths to frames and annotations - or positions in arrays
+        for container and raw arrays exports. If non existing, fills with None
 
         Args:
             file_type (str): in {'frame', 'annotation'}
 
         Returns:
-            type: str
+            type: str, int
         """
         path = dict()
         for key, file in self.index['files'].items():
             if file is None:
                 filepath = None
+            elif self.is_container or self.is_memmap:
+                filepath = file[file_type]
             else:
                 filepath = os.path.join(self.root, file[file_type])
             path.update({int(key): filepath})
@@ -277,6 +794,29 @@ class ProductDataset(Dataset):
     def __len__(self):
         return len(self._frames_path)
 
+    @classmethod
+    def set_max_open_files(cls, maxsize):
+        """Sets maximum number of hdf5 files kept open by product datasets
+        of current process
+
+        Args:
+            maxsize (int)
+        """
+        cls._handles_pool.maxsize = maxsize
+
+    @property
+    def n_files(self):
+        """Number of hdf5 files read through handles pool
+        """
+        if self.is_memmap:
+            n_files = 0
+        elif self.is_container:
+            n_files = 1
+        else:
+            paths = list(self._frames_path.values()) + list(self._annotations_path.values())
+            n_files = sum(path is not None for path in paths)
+        return n_files
+
     @property
     def root(self):
         return self._root
@@ -285,6 +825,14 @@ class ProductDataset(Dataset):
     def index(self):
         return self._index
 
+    @property
+    def is_container(self):
+        return self._is_container
+
+    @property
+    def is_memmap(self):
+        return self._is_memmap
+
     @property
     def frame_transform(self):
         return self._frame_transform
@@ -300,3 +848,77 @@ class ProductDataset(Dataset):
     @annotation_transform.setter
     def annotation_transform(self, transform):
         self._annotation_transform = transform
+
+
+class MultiProductDataset(Dataset):
+    """Flat concatenation of product datasets - typically one per generation seed
+
+    Unlike nested torch.utils.data.ConcatDataset obtained by summing datasets,
+    datasets are held in a single flat list and indexed through one cumulative
+    offsets array, such that any frame is retrieved in O(log n_datasets)
+
+    Product datasets are loaded in parallel threads at initialization to
+    read all indices at once
+
+    Args:
+        roots (list[str]): paths to directories where products have been dumped
+        frame_transform (callable): transformation applied to all loaded frames
+        annotation_transform (callable): transformation applied to all loaded annotations
+        max_workers (int): number of threads used to load product datasets
+    """
+    def __init__(self, roots, frame_transform=None, annotation_transform=None, max_workers=8):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            self._datasets = list(executor.map(ProductDataset, roots))
+        self._offsets = np.cumsum([0] + [len(dataset) for dataset in self.datasets])
+        self.set_frame_transform(frame_transform)
+        self.set_annotation_transform(annotation_transform)
+
+    def __getitem__(self, idx):
+        """Loads frame and annotation arrays from product dataset containing
+        specified index
+
+        Args:
+            idx (int): dataset index
+
+        Returns:
+            type: tuple[np.ndarray]
+        """
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Index {idx} out of range for dataset of size {len(self)}")
+        dataset_idx = np.searchsorted(self._offsets, idx, side='right') - 1
+        return self.datasets[dataset_idx][idx - self._offsets[dataset_idx]]
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def set_frame_transform(self, transform):
+        """Sets frame transform of all product datasets
+
+        Args:
+            transform (callable): np.ndarray -> np.ndarray
+        """
+        for dataset in self.datasets:
+            dataset.frame_transform = transform
+
+    def set_annotation_transform(self, transform):
+        """Sets annotation transform of all product datasets
+
+        Args:
+            transform (callable): np.ndarray -> np.ndarray
+        """
+        for dataset in self.datasets:
+            dataset.annotation_transform = transform
+
+    @property
+    def datasets(self):
+        return self._datasets
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    @property
+    def n_files(self):
+        return sum(dataset.n_files for dataset in self.datasets)
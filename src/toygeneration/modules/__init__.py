@@ -1,6 +1,6 @@
-from .samplers import ScalingSampler, GPSampler
-from .aggregate import conv_aggregation
+from .samplers import ScalingSampler, GPSampler, CirculantEmbeddingSampler
+from .aggregate import conv_aggregation, separable_block_reduce
 from .voronoi import generate_voronoi_polygons
 
-__all__ = ['conv_aggregation', 'ScalingSampler', 'GPSampler',
-           'generate_voronoi_polygons']
+__all__ = ['conv_aggregation', 'separable_block_reduce', 'ScalingSampler', 'GPSampler',
+           'CirculantEmbeddingSampler', 'generate_voronoi_polygons']
@@ -15,10 +15,65 @@ def conv_aggregation(kernel):
         type: (width, height, channel) np.ndarray
     """
     assert kernel.ndim == 2, "Kernel must be a 2-dimensional array"
+    factors = separable_factors(kernel)
     kernel = np.expand_dims(kernel, axis=-1)
 
     @wraps('conv_aggregation')
     def wrapper(blocks, axis):
         output = np.tensordot(blocks, kernel, axes=(axis, (0, 1, 2)))
         return output
+
+    # Expose kernel 1D factors if separable such that image can be aggregated
+    # without blocks view - see separable_block_reduce
+    wrapper.factors = factors
     return wrapper
+
+
+def separable_factors(kernel, rtol=1e-10):
+    """Factorizes 2-dimensional kernel as outer product of a rows kernel and a
+    columns kernel, e.g. heat kernels
+
+    Args:
+        kernel (np.ndarray): 2-dimensional kernel
+        rtol (float): relative tolerance on factorization error
+
+    Returns:
+        type: tuple[np.ndarray], None if kernel is not separable
+    """
+    total = kernel.sum()
+    if total == 0:
+        return None
+    rows_kernel = kernel.sum(axis=1)
+    cols_kernel = kernel.sum(axis=0) / total
+    if not np.allclose(np.outer(rows_kernel, cols_kernel), kernel, rtol=rtol, atol=0):
+        return None
+    return rows_kernel, cols_kernel
+
+
+def separable_block_reduce(img, factors):
+    """Aggregates non-overlapping blocks of image through convolution with a
+    separable kernel, computed as successive strided convolutions along rows
+    and columns. Equivalent to skimage.measure.block_reduce with conv_aggregation
+    in O(kernel_height + kernel_width) instead of O(kernel_height * kernel_width)
+    operations per pixel
+
+    Image dimensions must be multiples of kernel dimensions. Any number of
+    channels is supported, such that stacks of frames concatenated along
+    channels are aggregated at once
+
+    Args:
+        img (np.ndarray): (height, width, channels) image
+        factors (tuple[np.ndarray]): rows and columns 1D kernels - see separable_factors
+
+    Returns:
+        type: np.ndarray
+    """
+    rows_kernel, cols_kernel = factors
+    height, width, channels = img.shape
+    block_height, block_width = len(rows_kernel), len(cols_kernel)
+    output_height, output_width = height // block_height, width // block_width
+    # Convolve along rows : (output_height, block_height, width * channels) blocks view
+    output = np.matmul(rows_kernel, img.reshape(output_height, block_height, width * channels))
+    # Convolve along columns : (output_height * output_width, block_width, channels) blocks view
+    output = np.matmul(cols_kernel, output.reshape(output_height * output_width, block_width, channels))
+    return output.reshape(output_height, output_width, channels)
@@ -1,9 +1,114 @@
+import os
+import glob
+import hashlib
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 import numbers
 import numpy as np
 from src.utils import setseed
 
-CHOLESKY = {}
+
+class CholeskyCache:
+    """Cache of cholesky factors of kernel covariance matrices on 1D sampling
+    axes arange(length), keyed by kernel representation
+
+    As a cholesky factor leading block is the cholesky factor of covariance
+    matrix leading block, only the factor of largest length requested is kept
+    for each kernel and cropped for smaller lengths. Larger lengths trigger
+    a new factorization replacing the former one.
+
+    Least recently used factors are dropped when cached factors exceed maximum
+    memory. If a cache directory is specified, factors are also saved as .npy
+    files named after kernel representation hash and length, and loaded from
+    there in other processes or runs.
+
+    Args:
+        max_bytes (int): maximum memory size of cached factors
+        cache_dir (str): optional directory to save and load factors from
+    """
+    def __init__(self, max_bytes=2**30, cache_dir=None):
+        self._max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._factors = OrderedDict()
+
+    def get(self, kernel, length):
+        """Retrieves cholesky factor of kernel covariance matrix on arange(length)
+
+        Args:
+            kernel (sklearn.gaussian_process.kernel): kernel function (np.ndarray, np.ndarray) -> np.ndarray
+            length (int): sampling axis length
+
+        Returns:
+            type: np.ndarray
+        """
+        key = repr(kernel)
+        if key in self._factors and len(self._factors[key]) >= length:
+            self._factors.move_to_end(key)
+        else:
+            self._factors[key] = self._load_or_compute(kernel, length)
+            self._factors.move_to_end(key)
+            self._evict()
+        return self._factors[key][:length, :length]
+
+    def _load_or_compute(self, kernel, length):
+        """Loads factor of length greater or equal to specified one from cache
+        directory if any, else computes it and saves it
+
+        Args:
+            kernel (sklearn.gaussian_process.kernel): kernel function (np.ndarray, np.ndarray) -> np.ndarray
+            length (int): sampling axis length
+
+        Returns:
+            type: np.ndarray
+        """
+        if self.cache_dir:
+            lengths = [self._length_of(path) for path in glob.glob(self._path(kernel, '*'))]
+            lengths = [x for x in lengths if x >= length]
+            if lengths:
+                return np.load(self._path(kernel, min(lengths)))
+
+        factor = np.linalg.cholesky(kernel(np.expand_dims(np.arange(length), -1)))
+
+        if self.cache_dir:
+            # Write then rename such that concurrent processes never load partial files
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(kernel, length)
+            tmp_path = os.path.join(self.cache_dir, f".tmp_{os.getpid()}_{os.path.basename(path)}")
+            np.save(tmp_path, factor)
+            os.replace(tmp_path, path)
+        return factor
+
+    def _path(self, kernel, length):
+        digest = hashlib.sha1(repr(kernel).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"cholesky_{digest}_{length}.npy")
+
+    @staticmethod
+    def _length_of(path):
+        return int(os.path.basename(path)[:-len('.npy')].split('_')[-1])
+
+    def _evict(self):
+        """Drops least recently used factors until memory bound is met, always
+        keeping most recent one
+        """
+        while len(self._factors) > 1 and self.nbytes > self.max_bytes:
+            self._factors.popitem(last=False)
+
+    def clear(self):
+        self._factors = OrderedDict()
+
+    def __len__(self):
+        return len(self._factors)
+
+    @property
+    def nbytes(self):
+        return sum(factor.nbytes for factor in self._factors.values())
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+
+CHOLESKY = CholeskyCache()
 
 
 class Sampler(ABC):
@@ -22,20 +127,23 @@ class GPSampler(Sampler):
         size (tuple[int]): optional default size for sampled vectors
     """
 
-    def __init__(self, mean, kernel_name, kernel=None, size=None):
+    def __init__(self, mean, kernel, size=None):
         self._mean = mean
         self._kernel = kernel
         self._size = size
-        self._kernel_name = kernel_name
         if size:
             self._mu, self._choleskies = self._compute_params(size)
 
     @classmethod
-    def _cache_cholesky(cls, name, size, kernel):
-        global CHOLESKY
-        t = cls._get_sampling_points(size)
-        cholesky = cls._compute_cholesky_kronecker_decomposition(kernel, t)
-        CHOLESKY[name] = cholesky
+    def _cache_cholesky(cls, size, kernel):
+        """Computes and caches cholesky factors of kronecker components of
+        covariance matrix such that smaller sizes are cropped from them
+
+        Args:
+            size (tuple[int]): (length,) or (height, width) like tuples
+            kernel (sklearn.gaussian_process.kernel): kernel function (np.ndarray, np.ndarray) -> np.ndarray
+        """
+        cls._compute_cholesky_kronecker_decomposition(kernel, cls._get_sampling_points(size))
 
     @classmethod
     def _get_sampling_points(cls, size):
@@ -82,7 +190,7 @@ class GPSampler(Sampler):
     @classmethod
     def _compute_cholesky_kronecker_decomposition(cls, kernel, sampling_points):
         """Compute cholesky factor of kronecker components of covariance matrix
-        on each individual sampling axis
+        on each individual sampling axis, reusing factors from CHOLESKY cache
 
         Args:
             kernel (sklearn.gaussian_process.kernel): kernel function (np.ndarray, np.ndarray) -> np.ndarray
@@ -91,33 +199,9 @@ class GPSampler(Sampler):
         Returns:
             type: list[np.ndarray]
         """
-        choleskies = []
-        for sampling_axis in sampling_points:
-            K = kernel(sampling_axis)
-            choleskies += [np.linalg.cholesky(K)]
+        choleskies = [CHOLESKY.get(kernel, len(sampling_axis)) for sampling_axis in sampling_points]
         return choleskies
 
-    @classmethod
-    def _crop_cholesky_kronecker_decomposition(cls, kernel_name, sampling_points):
-        """Crops kronecker decomposition according to sampling points dimensions
-        from CHOLESKY global dict
-
-        Args:
-            kernel_name (str): name of kernel
-            sampling_points (tuple[np.ndarray]): tuple of sampling points arrays
-
-        Returns:
-            type: list[np.ndarray]
-        """
-        if len(sampling_points) == 1:
-            len_x, len_y = list(map(len, sampling_points))
-            cholesky = [x[:len(len_x), :len(len_y)] for x in CHOLESKY[kernel_name]]
-        elif len(sampling_points) == 2:
-            cholesky = [x[:len(axis), :len(axis)] for x, axis in zip(CHOLESKY[kernel_name], sampling_points)]
-        else:
-            raise ValueError(f"Requested size has {len(sampling_points)} dimensions - up to 2 dimenions supported")
-        return cholesky
-
     def _compute_params(self, size):
         """Computes mean vector and cholesky decomposition given sampling points
         size
@@ -133,10 +217,7 @@ class GPSampler(Sampler):
 
         # Compute mean vector and cholesky factor
         mu = self._compute_mean(self.mean, t)
-        if CHOLESKY:
-            cholesky = self._crop_cholesky_kronecker_decomposition(self.kernel_name, t)
-        else:
-            cholesky = self._compute_cholesky_kronecker_decomposition(self.kernel, t)
+        cholesky = self._compute_cholesky_kronecker_decomposition(self.kernel, t)
         return mu, cholesky
 
     def _scale_by_cholesky(self, cholesky, x):
@@ -230,6 +311,42 @@ class GPSampler(Sampler):
         X = self._reshape_output(X, size, channels)
         return X
 
+    @setseed('numpy')
+    def sample_batch(self, sizes, n=None, seed=None):
+        """Samples from GP on multiple aranges of inducing points at once
+
+        All N(0, I) vectors are drawn in a single pass and split in draw order,
+        such that samples match [self(size) for size in sizes] under same seed.
+        Each sample is then scaled by its cropped cholesky factors with a
+        matrix product batched over channels.
+
+        Args:
+            sizes (list[tuple[int]]): list of (height, width) sampling sizes
+            n (int): if specified, samples are (height, width, n) arrays
+            seed (int): random seed
+
+        Returns:
+            type: list[np.ndarray]
+        """
+        if any(len(size) != 2 for size in sizes):
+            raise ValueError("Batch sampling only supported for (height, width) sizes")
+        channels = n or 1
+
+        # Sample from N(0, I) for all sizes at once
+        lengths = [channels * np.prod(size) for size in sizes]
+        x = np.random.standard_normal(np.sum(lengths, dtype=int))
+        xs = np.split(x, np.cumsum(lengths)[:-1])
+
+        samples = []
+        for x, size in zip(xs, sizes):
+            mu, (L1, L2) = self._compute_params(size)
+
+            # Lx = L2 @ x @ L1.T channelwise, laid out as in self._scale_by_cholesky
+            Lx = np.matmul(np.matmul(L2, x.reshape(channels, len(L2), len(L1))), L1.T)
+            X = mu + np.moveaxis(Lx, 0, -1).reshape(-1, mu.shape[0])
+            samples += [self._reshape_output(X, size, n)]
+        return samples
+
     def _handle_input_dims(self, size):
         """Handles separation between width, height anf channels
 
@@ -278,10 +395,6 @@ class GPSampler(Sampler):
     def kernel(self):
         return self._kernel
 
-    @property
-    def kernel_name(self):
-        return self._kernel_name
-
     @property
     def size(self):
         return self._size
@@ -296,7 +409,7 @@ class ScalingSampler(GPSampler):
         size (int): optional default size for sampled vectors
     """
     def __init__(self, kernel, size=None):
-        super().__init__(mean=np.zeros_like, kernel=kernel, size=size)
+        super().__init__(mean=lambda x: np.zeros(x.shape[0]), kernel=kernel, size=size)
 
     def _as_scaling_factor(self, x):
         return 1 + 0.5 * np.tanh(x)
@@ -305,3 +418,146 @@ class ScalingSampler(GPSampler):
         X = super().__call__(size=size, seed=seed)
         X = self._as_scaling_factor(X)
         return X
+
+
+class CirculantEmbeddingSampler(Sampler):
+    """Zero-mean stationary Gaussian Process sampling class based on circulant
+    embedding of covariance matrix
+
+    As for GPSampler, covariance matrix is the kronecker product of covariance
+    matrices on each sampling axis. Each axis is embedded in a periodic one of
+    about twice its length on which covariance matrix is circulant and hence
+    diagonalized by the discrete Fourier transform. Sampling then boils down to
+    scaling a N(0, I) complex vector by the square root of covariance
+    eigenvalues and taking its FFT, in O(N log N) for N sampling points instead
+    of O(N^(3/2)) for cholesky factors computation.
+
+    Kernel must be stationary, e.g. 'rbf', 'rational_quadratic' or
+    'sin_squared'. Embeddings are enlarged until covariance is non-negative
+    definite, which may fail for kernels with long range correlations. Remaining
+    negative eigenvalues are then clipped to zero and sampled covariance is
+    approximate.
+
+    Args:
+        kernel (sklearn.gaussian_process.kernel): stationary kernel function (np.ndarray, np.ndarray) -> np.ndarray
+        size (tuple[int]): optional default size for sampled vectors
+    """
+    max_embedding_ratio = 4
+    tol = 1e-6
+
+    def __init__(self, kernel, size=None):
+        self._kernel = kernel
+        self._size = size
+        self._sqrt_eigenvalues = dict()
+
+    def _compute_eigenvalues(self, embedding_length):
+        """Computes covariance matrix eigenvalues on periodic embedding axis
+
+        Args:
+            embedding_length (int): length of periodic embedding axis
+
+        Returns:
+            type: np.ndarray
+        """
+        # Compute shortest periodic lags between embedding points and origin
+        m = embedding_length
+        lags = np.minimum(np.arange(m), m - np.arange(m))
+
+        # Covariance first row eigenvalues are given by its FFT
+        c = self.kernel(np.expand_dims(lags, -1), np.zeros((1, 1)))[:, 0]
+        eigenvalues = np.fft.fft(c).real
+        return eigenvalues
+
+    def _compute_sqrt_eigenvalues(self, length):
+        """Computes square root of circulant embedding covariance eigenvalues
+        of sampling axis, normalized for unnormalized forward FFT
+
+        Embedding length is increased from 2 * (length - 1) until covariance
+        is non-negative definite, up to self.max_embedding_ratio times, remaining
+        negative eigenvalues are clipped
+
+        Args:
+            length (int): sampling axis length
+
+        Returns:
+            type: np.ndarray
+        """
+        if length not in self._sqrt_eigenvalues:
+            min_length = max(2 * (length - 1), 1)
+            for embedding_length in range(min_length, self.max_embedding_ratio * min_length + 1):
+                eigenvalues = self._compute_eigenvalues(embedding_length)
+                if eigenvalues.min() >= -self.tol * eigenvalues.max():
+                    break
+            eigenvalues = eigenvalues.clip(min=0)
+            self._sqrt_eigenvalues[length] = np.sqrt(eigenvalues / len(eigenvalues))
+        return self._sqrt_eigenvalues[length]
+
+    def _sample(self, size, channels):
+        """Samples (channels, *size) array - real and imaginary parts of each
+        FFT being independent, one complex field is drawn every two channels
+
+        Args:
+            size (tuple[int]): (length,) or (height, width) sampling size
+            channels (int): number of channels to sample
+
+        Returns:
+            type: np.ndarray
+        """
+        # Eigenvalues of kronecker product are outer product of eigenvalues
+        sqrt_eigenvalues = np.ones(())
+        for length in size:
+            sqrt_eigenvalues = np.multiply.outer(sqrt_eigenvalues, self._compute_sqrt_eigenvalues(length))
+
+        n_fields = (channels + 1) // 2
+        x = np.random.standard_normal((2, n_fields) + sqrt_eigenvalues.shape)
+        x = sqrt_eigenvalues * (x[0] + 1j * x[1])
+        axes = tuple(range(1, len(size) + 1))
+        Lx = np.fft.fftn(x, axes=axes)
+        Lx = np.concatenate([Lx.real, Lx.imag])[:channels]
+        return Lx[(slice(None), ) + tuple(slice(s) for s in size)]
+
+    @setseed('numpy')
+    def __call__(self, size=None, seed=None):
+        """Samples from GP on a an arange of inducing points dimensioned according
+        to size specifications
+
+        Args:
+            size (tuple[int]): (length,) or (height, width) or
+                (height, width, channels) of inducing points array
+            seed (int): random seed
+
+        Returns:
+            type: np.ndarray
+        """
+        size = size or self.size
+        if not size:
+            raise TypeError("Must specify a sampling size")
+        if len(size) == 3:
+            X = self._sample(size=tuple(size[:2]), channels=size[2])
+            X = X.transpose((1, 2, 0))
+        else:
+            X = self._sample(size=tuple(size), channels=1)[0]
+        return X
+
+    @setseed('numpy')
+    def sample_batch(self, sizes, n=None, seed=None):
+        """Samples from GP on multiple aranges of inducing points - see
+        GPSampler.sample_batch
+
+        Args:
+            sizes (list[tuple[int]]): list of (height, width) sampling sizes
+            n (int): if specified, samples are (height, width, n) arrays
+            seed (int): random seed
+
+        Returns:
+            type: list[np.ndarray]
+        """
+        return [self(size=tuple(size) + ((n, ) if n else ())) for size in sizes]
+
+    @property
+    def kernel(self):
+        return self._kernel
+
+    @property
+    def size(self):
+        return self._size
@@ -45,6 +45,46 @@ def build_cloud_and_bias_transform(cfg):
         - Simulates random cloud-like image occultation
         - Rescales and biases pixel values with fixed weights
 
+    Args:
+        cfg (dict): configuration dict
+    """
+    cloud_layer = CloudLayer(**make_cloud_kwargs(cfg))
+    add_and_mult = MultiplyAndAdd(mul=(cfg['mul']['min'], cfg['mul']['max']),
+                                  add=(cfg['add']['min'], cfg['add']['max']),
+                                  seed=cfg['seed'])
+
+    cloud_and_bias_transform = iaa.Sequential([iaa.Sometimes(cfg['cloud_probability'], cloud_layer),
+                                               add_and_mult])
+    return cloud_and_bias_transform
+
+
+@TRANSFORMS.register('batch_cloud_and_brightness')
+def build_batch_cloud_and_bias_transform(cfg):
+    """Drop-in replacement of 'cloud_and_brightness' transformation drawing
+        clouds of stacks of images at once with BatchCloudLayer
+
+        - Simulates random cloud-like image occultation, optionally temporally
+            correlated
+        - Rescales and biases pixel values with fixed weights
+
+    Args:
+        cfg (dict): configuration dict
+    """
+    cloud_layer = BatchCloudLayer(**make_cloud_kwargs(cfg),
+                                  temporal_correlation=cfg.get('temporal_correlation') or 0.,
+                                  probability=cfg['cloud_probability'])
+    add_and_mult = MultiplyAndAdd(mul=(cfg['mul']['min'], cfg['mul']['max']),
+                                  add=(cfg['add']['min'], cfg['add']['max']),
+                                  seed=cfg['seed'])
+
+    # Clouding probability is handled by the layer to keep temporal correlation over skipped frames
+    cloud_and_bias_transform = iaa.Sequential([cloud_layer, add_and_mult])
+    return cloud_and_bias_transform
+
+
+def make_cloud_kwargs(cfg):
+    """Cloud layer parameters shared by cloud transformations
+
     Args:
         cfg (dict): configuration dict
     """
@@ -57,15 +97,7 @@ def build_cloud_and_bias_transform(cfg):
                     'alpha_freq_exponent': -1.5,                       # exponent of frequency of the alpha mask noise, lower = coarser ; recommend [-4.0, -1.5]
                     'sparsity': cfg['cloud_sparsity'],                 # exponent ; lower = coarser ; around 1.
                     'density_multiplier': cfg['cloud_density']}        # higher = denser ; [0.5, 1.5]
-
-    cloud_layer = CloudLayer(**cloud_kwargs)
-    add_and_mult = MultiplyAndAdd(mul=(cfg['mul']['min'], cfg['mul']['max']),
-                                  add=(cfg['add']['min'], cfg['add']['max']),
-                                  seed=cfg['seed'])
-
-    cloud_and_bias_transform = iaa.Sequential([iaa.Sometimes(cfg['cloud_probability'], cloud_layer),
-                                               add_and_mult])
-    return cloud_and_bias_transform
+    return cloud_kwargs
 
 
 @TRANSFORMS.register('speckle')
@@ -96,5 +128,6 @@ def build_tangential_scale_distortion_transform(cfg):
     distortion = TangentialScaleDistortion(image_size=(cfg['image_height'], cfg['image_width']),
                                            mesh_size=(cfg['mesh_columns_cells'], cfg['mesh_rows_cells']),
                                            axis=cfg['axis'],
-                                           growth_rate=cfg['growth_rate'])
+                                           growth_rate=cfg['growth_rate'],
+                                           cache_dir=cfg['cache_dir'])
     return distortion
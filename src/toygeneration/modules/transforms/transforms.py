@@ -1,10 +1,13 @@
+import os
 from abc import ABC, abstractmethod
 import numpy as np
 import random
 from PIL import Image
+from scipy import fft, ndimage
+from scipy.signal import lfilter
 import imgaug.augmenters as iaa
 import imgaug.parameters as iap
-from skimage.transform import PiecewiseAffineTransform, warp
+from skimage.transform import PiecewiseAffineTransform, warp, warp_coords
 from src.utils import setseed
 
 
@@ -63,6 +66,11 @@ class TangentialScaleDistortion(iaa.Augmenter):
     """Emulation of imagery tangential distortion with piecewise affine
     transformation
 
+    As mesh never changes, the inverse coordinates map of the transformation
+    is computed once at construction, such that warping an image only takes
+    a single interpolation pass. It can optionally be cached on disk. The
+    augmenter is hence flagged as deterministic.
+
     Args:
         image_size (tuple[int]): (width, height)
         mesh_size (tuple[int]): (n_cells_columns, n_cells_rows) number of mesh cells in
@@ -70,15 +78,22 @@ class TangentialScaleDistortion(iaa.Augmenter):
         axis (int): distortion axis {height/rows: 0, width/columns: 1}
         growth_rate (float): sigmoid growth rate parameter
             (default : 4 / length_distortion_axis)
+        cache_dir (str): optional directory where inverse coordinates map is
+            saved and loaded from
     """
-    def __init__(self, image_size, mesh_size, axis=0, growth_rate=None):
+    def __init__(self, image_size, mesh_size, axis=0, growth_rate=None, cache_dir=None):
         super().__init__(name='tangential_scale_distortion')
+        self.deterministic = True
         self.axis = axis
+        self._image_size = tuple(image_size)
         self._swath_length = image_size[axis]
         self._growth_rate = growth_rate or 4 / self.swath_length
         self._transform = self._build_transform(image_size=image_size,
                                                 mesh_size=mesh_size,
                                                 axis=axis)
+        self._coordinates = self._build_coordinates_map(image_size=image_size,
+                                                        mesh_size=mesh_size,
+                                                        cache_dir=cache_dir)
 
     def _build_source_meshgrid(self, image_size, mesh_size):
         """Creates meshgrids of image size and number of mesh specified
@@ -119,7 +134,7 @@ class TangentialScaleDistortion(iaa.Augmenter):
 
         tgt = np.vstack([tgt_cols, tgt_rows]).T
         bounds = np.array([np.min(tgt_rows), np.max(tgt_rows),
-                           np.min(tgt_cols), np.max(tgt_cols)], dtype=np.int)
+                           np.min(tgt_cols), np.max(tgt_cols)], dtype=int)
         return tgt, bounds
 
     def _deform_axis(self, coordinates):
@@ -161,6 +176,38 @@ class TangentialScaleDistortion(iaa.Augmenter):
         transform.estimate(tgt, src)
         return transform
 
+    def _build_coordinates_map(self, image_size, mesh_size, cache_dir=None):
+        """Computes dense inverse coordinates map of transform restricted to
+        cropping bounds, i.e. for each output pixel, the (row, col) input
+        coordinates to interpolate from
+
+        Args:
+            image_size (tuple[int]): (height, width)
+            mesh_size (tuple[int]): (n_cells_rows, n_cells_columns)
+            cache_dir (str): optional directory to save and load map from
+
+        Returns:
+            type: np.ndarray
+        """
+        if cache_dir:
+            filename = "tangential_distortion_{}x{}_mesh_{}x{}_axis_{}_rate_{}.npy".format(*image_size, *mesh_size,
+                                                                                          self.axis, self.growth_rate)
+            cache_path = os.path.join(cache_dir, filename)
+            if os.path.exists(cache_path):
+                return np.load(cache_path)
+
+        coordinates = warp_coords(self.transform, image_size)
+        coordinates = coordinates[:, self.bounds[0]: self.bounds[1],
+                                  self.bounds[2]: self.bounds[3]]
+
+        if cache_dir:
+            # Write then rename such that concurrent processes never load partial files
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = os.path.join(cache_dir, f".tmp_{os.getpid()}_{filename}")
+            np.save(tmp_path, coordinates)
+            os.replace(tmp_path, cache_path)
+        return coordinates
+
     def augment_image(self, image):
         """Wraps transform on img and crop at new size
         Args:
@@ -169,9 +216,15 @@ class TangentialScaleDistortion(iaa.Augmenter):
         Returns:
             type: np.ndarray
         """
-        image = warp(image, self.transform)
-        image = image[self.bounds[0]: self.bounds[1],
-                      self.bounds[2]: self.bounds[3]]
+        if image.shape[:2] != self._image_size:
+            # Coordinates map does not apply, warp with transform instead
+            image = warp(image, self.transform)
+            image = image[self.bounds[0]: self.bounds[1],
+                          self.bounds[2]: self.bounds[3]]
+        elif image.ndim == 3:
+            image = np.dstack([warp(image[..., i], self.coordinates) for i in range(image.shape[-1])])
+        else:
+            image = warp(image, self.coordinates)
         return image
 
     def _augment_images(self, images):
@@ -213,6 +266,10 @@ class TangentialScaleDistortion(iaa.Augmenter):
     def transform(self):
         return self._transform
 
+    @property
+    def coordinates(self):
+        return self._coordinates
+
     @property
     def bounds(self):
         return self._bounds
@@ -282,6 +339,219 @@ class CloudLayer(iaa.Augmenter):
         return self.__dict__
 
 
+class BatchCloudLayer(iaa.Augmenter):
+    """Native cloud layer generator drawing clouds of a whole stack of images
+    valued in range [0, 1] at once
+
+    Follows iaa.CloudLayer : clouds alpha mask and fine intensity details are
+    frequency noises with power law spectrum and coarse intensity is an
+    upscaled (8, 8) gaussian noise. Noises of all images are however drawn with
+    a single inverse real FFT over the stack, at low resolution, and upscaled
+    with cached cubic interpolation matrices. Images are blended in float32
+    without rescaling to [0, 255].
+
+    If temporal_correlation is positive, noises spectra of successive images
+    follow an AR(1) process such that clouds smoothly evolve across the horizon
+    instead of being drawn independently for each frame. Process state carries
+    over successive calls, images must hence be fed in chronological order.
+    Frames are hence clouded with given probability by the layer itself rather
+    than by wrapping it with iaa.Sometimes : noises are drawn for all frames
+    such that the process runs over the full horizon, and clouds are then only
+    blended on sampled frames.
+
+    Args:
+        intensity_mean (float): mean clouds color ; 0 - 255
+        intensity_freq_exponent (float): exponent of frequency of the intensity noise
+        intensity_coarse_scale (float): std of coarse intensity noise ; 0 - 255
+        alpha_min (float): minimum alpha when blending cloud noise with the image
+        alpha_multiplier (float): high values will lead to denser clouds
+        alpha_size_px_max (int): image size at which the alpha mask is sampled
+        alpha_freq_exponent (float): exponent of frequency of the alpha mask noise
+        sparsity (float): alpha mask exponent ; lower = coarser
+        density_multiplier (float): alpha mask multiplier ; higher = denser
+        temporal_correlation (float): correlation in [0, 1) of noises of
+            successive images (default: 0, independent clouds)
+        probability (float): likelihood of clouding each image (default: 1)
+    """
+    def __init__(self, intensity_mean, intensity_freq_exponent, intensity_coarse_scale,
+                 alpha_min, alpha_multiplier, alpha_size_px_max, alpha_freq_exponent,
+                 sparsity, density_multiplier, temporal_correlation=0., probability=1., seed=None, name=None,
+                 random_state="deprecated", deterministic="deprecated"):
+        super().__init__(seed=seed, name=name, random_state=random_state, deterministic=deterministic)
+        if not 0 <= temporal_correlation < 1:
+            raise ValueError("Temporal correlation must be in [0, 1)")
+        self.intensity_mean = intensity_mean / 255
+        self.intensity_freq_exponent = intensity_freq_exponent
+        self.intensity_coarse_scale = intensity_coarse_scale / 255
+        self.alpha_min = alpha_min
+        self.alpha_multiplier = alpha_multiplier
+        self.alpha_size_px_max = alpha_size_px_max
+        self.alpha_freq_exponent = alpha_freq_exponent
+        self.sparsity = sparsity
+        self.density_multiplier = density_multiplier
+        self.temporal_correlation = temporal_correlation
+        self.probability = probability
+        self._noises_state = dict()
+        self._interpolation_matrices = dict()
+
+    def augment_image(self, image):
+        return self.draw_on_images(images=image[None], random_state=self.random_state)[0]
+
+    def _augment_batch_(self, batch, random_state, parents, hooks):
+        if batch.images is not None and len(batch.images) > 0:
+            images = self.draw_on_images(images=np.stack(batch.images), random_state=random_state)
+            batch.images = images if isinstance(batch.images, np.ndarray) else list(images)
+        return batch
+
+    def draw_on_images(self, images, random_state):
+        """Blends stack of images with clouds
+
+        Args:
+            images (np.ndarray): (n_images, height, width, channels) or
+                (n_images, height, width) stack valued in [0, 1]
+            random_state (imgaug.random.RNG)
+
+        Returns:
+            type: np.ndarray
+        """
+        n_images, height, width = images.shape[:3]
+        clouded = random_state.random(n_images) < self.probability
+        alpha, intensity = self.generate_maps(n_images, height, width, random_state)
+        # Leave images which are not sampled for clouding untouched
+        alpha[~clouded] = 0
+        if images.ndim == 4:
+            alpha, intensity = alpha[..., None], intensity[..., None]
+        # Compute (1 - alpha) * image + alpha * intensity in place
+        output = intensity - images.astype(np.float32, copy=False)
+        output *= alpha
+        output += images
+        return output
+
+    def generate_maps(self, n_images, height, width, random_state):
+        """Draws clouds alpha masks and intensities for a stack of images
+
+        Args:
+            n_images (int): number of images
+            height (int)
+            width (int)
+            random_state (imgaug.random.RNG)
+
+        Returns:
+            type: np.ndarray, np.ndarray as (n_images, height, width) float32 arrays
+        """
+        # Draw clouds intensities
+        coarse_noise = self._draw_white_noise('intensity_coarse', (n_images, 8, 8), random_state)
+        intensity_coarse = self.intensity_mean + self.intensity_coarse_scale * self._upscale(coarse_noise, height, width)
+        intensity_fine = self._draw_frequency_noise('intensity_fine', n_images, height, width,
+                                                    exponent=self.intensity_freq_exponent,
+                                                    size_px_max=max(height, width),
+                                                    random_state=random_state)
+        intensity = intensity_coarse + self.intensity_mean * (2 * intensity_fine - 1) / 5
+
+        # Draw clouds alpha masks
+        alpha = self._draw_frequency_noise('alpha', n_images, height, width,
+                                           exponent=self.alpha_freq_exponent,
+                                           size_px_max=self.alpha_size_px_max,
+                                           random_state=random_state)
+        alpha = self.alpha_min + self.alpha_multiplier * alpha
+        alpha = np.clip(np.power(alpha, self.sparsity) * self.density_multiplier, 0, 1)
+        return alpha, intensity
+
+    def _draw_frequency_noise(self, key, n_images, height, width, exponent, size_px_max, random_state):
+        """Draws stack of frequency noises valued in [0, 1] with power law
+        spectrum at low resolution and upscales it - see iap.FrequencyNoise
+
+        Returns:
+            type: np.ndarray as (n_images, height, width) float32 array
+        """
+        # Compute low resolution dimensions
+        downscale_factor = min(1, size_px_max / max(height, width))
+        h_small = max(int(height * downscale_factor), 4)
+        w_small = max(int(width * downscale_factor), 4)
+
+        # Scale complex white noise spectrum with power law of frequencies
+        rows = np.arange(h_small)
+        frequencies = np.hypot(np.minimum(rows, h_small - rows)[:, None], np.arange(w_small // 2 + 1))
+        frequencies[0, 0] = 1
+        scale = frequencies ** exponent
+        scale[0, 0] = 0
+        spectrum = self._draw_white_noise(key, (n_images, h_small, w_small // 2 + 1), random_state, is_complex=True)
+        noise = fft.irfft2(spectrum * scale.astype(np.float32), s=(h_small, w_small)).astype(np.float32, copy=False)
+
+        # Normalize each noise to [0, 1] and upscale
+        noise -= noise.min(axis=(1, 2), keepdims=True)
+        noise /= noise.max(axis=(1, 2), keepdims=True)
+        noise = np.clip(self._upscale(noise, height, width), 0, 1)
+        return noise
+
+    def _draw_white_noise(self, key, size, random_state, is_complex=False):
+        """Draws stack of standard gaussian noises, correlated along first axis
+        as an AR(1) process if temporal correlation is positive
+
+        Args:
+            key (str): noise name under which AR(1) process state is kept
+            size (tuple[int]): (n_images, ...) noise stack size
+            random_state (imgaug.random.RNG)
+            is_complex (bool): if True, draws complex noise
+
+        Returns:
+            type: np.ndarray
+        """
+        noise = random_state.standard_normal(size=size)
+        if is_complex:
+            noise = noise + 1j * random_state.standard_normal(size=size)
+        rho = self.temporal_correlation
+        if rho > 0:
+            innovation_scale = np.sqrt(1 - rho ** 2)
+            previous = self._noises_state.get(key)
+            if previous is None or previous.shape != size[1:]:
+                # Initialize process such that first noise is kept as is
+                previous = noise[0] * (1 - innovation_scale) / rho
+            noise, _ = lfilter([innovation_scale], [1, -rho], noise, axis=0, zi=rho * previous[None])
+            self._noises_state[key] = noise[-1]
+        return noise
+
+    def _upscale(self, noise, height, width):
+        """Upscales stack of noises with separable cubic interpolation
+
+        Args:
+            noise (np.ndarray): (n_images, h_small, w_small) stack
+            height (int)
+            width (int)
+
+        Returns:
+            type: np.ndarray as (n_images, height, width) float32 array
+        """
+        n_images, h_small, w_small = noise.shape
+        noise = noise.astype(np.float32)
+        if w_small != width:
+            # Interpolate along columns as a single (n_images * h_small, w_small) matrix product
+            cols_interpolation = self._interpolation_matrix(w_small, width)
+            noise = (noise.reshape(-1, w_small) @ cols_interpolation.T).reshape(n_images, h_small, width)
+        if h_small != height:
+            # Interpolate along rows as a single (h_small, n_images * width) matrix product
+            rows_interpolation = self._interpolation_matrix(h_small, height)
+            noise = rows_interpolation @ noise.transpose(1, 0, 2).reshape(h_small, -1)
+            noise = noise.reshape(height, n_images, width).transpose(1, 0, 2)
+        return noise
+
+    def _interpolation_matrix(self, input_length, output_length):
+        """Cubic spline interpolation operator from input_length to output_length
+        samples as a (output_length, input_length) matrix, cached
+        """
+        key = (input_length, output_length)
+        if key not in self._interpolation_matrices:
+            identity = np.eye(input_length, dtype=np.float32)
+            matrix = ndimage.zoom(identity, (output_length / input_length, 1), order=3)
+            # Spline prefiltering leaves denormal coefficients which dramatically slow down products
+            matrix[np.abs(matrix) < 1e-7] = 0
+            self._interpolation_matrices[key] = matrix
+        return self._interpolation_matrices[key]
+
+    def get_parameters(self):
+        return self.__dict__
+
+
 class MultiplyAndAdd(iaa.Augmenter):
     """Draws static random scaling and bias scalars (w, b). Any input array x
         is transformed as w*x + b
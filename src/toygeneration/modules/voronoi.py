@@ -1,5 +1,6 @@
 import numpy as np
 from scipy.spatial import Voronoi
+import shapely
 from shapely import geometry
 from src.utils import setseed
 
@@ -29,7 +30,38 @@ def generate_voronoi_polygons(n, aspect_ratio=1, seed=None):
     regions, vertices = voronoi_finite_polygons_2d(vor)
 
     # Encapsulate as shapely instances and intersect with background
-    polygons = [background.intersection(geometry.Polygon(vertices[region])) for region in regions]
+    polygons = clip_regions(regions, vertices, background)
+    return polygons
+
+
+def clip_regions(regions, vertices, background):
+    """Intersects regions with rectangular background polygon. Only regions
+    with vertices out of background are actually intersected, in bulk with
+    shapely vectorized operations if available (shapely >= 2.0)
+
+    Args:
+        regions (list[list[int]]): indices of vertices of each region
+        vertices (np.ndarray): vertices coordinates
+        background (shapely.geometry.Polygon): rectangular background polygon
+
+    Returns:
+        type: list[shapely.geometry.Polygon]
+    """
+    # Find regions crossing background boundaries
+    xmin, ymin, xmax, ymax = background.bounds
+    outside = (vertices[:, 0] < xmin) | (vertices[:, 0] > xmax) | (vertices[:, 1] < ymin) | (vertices[:, 1] > ymax)
+    crossing = np.array([outside[region].any() for region in regions])
+
+    if hasattr(shapely, 'intersection'):
+        ring_indices = np.repeat(np.arange(len(regions)), [len(region) for region in regions])
+        rings = shapely.linearrings(vertices[np.concatenate(regions)], indices=ring_indices)
+        polygons = shapely.polygons(rings)
+        polygons[crossing] = shapely.intersection(polygons[crossing], background)
+        polygons = polygons.tolist()
+    else:
+        polygons = [geometry.Polygon(vertices[region]) for region in regions]
+        polygons = [background.intersection(polygon) if is_crossing else polygon
+                    for polygon, is_crossing in zip(polygons, crossing)]
     return polygons
 
 
@@ -68,44 +100,36 @@ def voronoi_finite_polygons_2d(vor, radius=None):
     if vor.points.shape[1] != 2:
         raise ValueError("Requires 2D input")
 
-    # Initialize finite regions and vertices lists
-    output_regions = []
-    output_vertices = vor.vertices.tolist()
-
     # Compute center point and replacement radius for points at infinity
     center = get_center_point(vor)
     if radius is None:
         radius = get_radius(vor)
 
-    # Construct a map containing all ridges for a given region point
-    point2ridges = map_points_to_ridges(vor)
-
-    # Reconstruct infinite regions
-    for point_idx, region_idx in enumerate(vor.point_region):
-        # Retrieve region vertices and ridges indices
-        region_vertices = vor.regions[region_idx]
-        region_ridges = point2ridges[point_idx]
-
-        if all(v >= 0 for v in region_vertices):
-            # already a finite region
-            output_regions.append(region_vertices)
-
-        else:
-            new_region, output_vertices = reconstruct_incomplete_region(vor=vor,
-                                                                        point=point_idx,
-                                                                        vertices=region_vertices,
-                                                                        ridges=region_ridges,
-                                                                        center=center,
-                                                                        radius=radius,
-                                                                        new_vertices=output_vertices)
-
-            # sort region counterclockwise
-            new_region = sort_region(new_region, output_vertices)
-
-            # finish
-            output_regions.append(new_region.tolist())
-
-    return output_regions, np.asarray(output_vertices)
+    # Compute finite endpoints of semi-infinite ridges as new vertices
+    ridge_points = vor.ridge_points
+    ridge_vertices = np.array(vor.ridge_vertices)
+    infinite = np.any(ridge_vertices < 0, axis=1)
+    missing_vertices = get_missing_endpoints(vor=vor,
+                                             ridge_points=ridge_points[infinite],
+                                             ridge_vertices=ridge_vertices[infinite],
+                                             center=center,
+                                             radius=radius)
+    output_vertices = np.concatenate([vor.vertices, missing_vertices])
+
+    # Replace infinite vertices of ridges by their finite endpoints
+    ridge_vertices[infinite] = ridge_vertices[infinite].max(axis=1, keepdims=True)
+    ridge_vertices[infinite, 0] = len(vor.vertices) + np.arange(infinite.sum())
+
+    # Regions are made of vertices of ridges around their point
+    region_points = np.repeat(ridge_points, 2, axis=1).flatten()
+    region_vertices = np.tile(ridge_vertices, 2).flatten()
+
+    # Sort regions counterclockwise
+    output_regions = sort_regions(region_points=region_points,
+                                  region_vertices=region_vertices,
+                                  vertices=output_vertices,
+                                  n_regions=len(vor.points))
+    return output_regions, output_vertices
 
 
 def get_center_point(vor):
@@ -134,100 +158,62 @@ def get_radius(vor):
     return radius
 
 
-def map_points_to_ridges(vor):
-    """Maps each region point to all of its ridges as :
-    {point_1 : (neighbour_region_point, ridge_vertex_1, ridge_vertex_2)}
-
-    Args:
-        vor (scipy.spatial.Voronoi): Input Voronoi diagram instance
-
-    Returns:
-        type: dict
-    """
-    point2ridges = {}
-    for (p1, p2), (v1, v2) in vor.ridge_dict.items():
-        point2ridges.setdefault(p1, []).append((p2, v1, v2))
-        point2ridges.setdefault(p2, []).append((p1, v1, v2))
-    return point2ridges
-
-
-def get_missing_endpoint(vor, p1, p2, v2, center, radius):
-    """Computes replacement finite vertex for semi-infinite ridges
+def get_missing_endpoints(vor, ridge_points, ridge_vertices, center, radius):
+    """Computes replacement finite vertices for semi-infinite ridges
 
     Args:
         vor (scipy.spatial.Voronoi): Input Voronoi diagram instance
-        p1 (int): index of source point
-        p2 (int): index of target point
-        v2 (int): index of ridge's single finite vertex (always second)
+        ridge_points (np.ndarray): (n_ridges, 2) indices of points separated by ridges
+        ridge_vertices (np.ndarray): (n_ridges, 2) indices of ridges vertices,
+            one of them being -1
         center (np.ndarray): center point
         radius (float): replacement radius to use for infinite vertices
 
     Returns:
         type: np.ndarray
     """
-    # Compute tangent unitary vector to ridge
-    n = vor.points[p2] - vor.points[p1]
-    n /= np.linalg.norm(n)
-    t = np.array([-n[1], n[0]])
-
-    # Orient vector by comparing point on ridge to center
-    ridge_point = vor.points[[p1, p2]].mean(axis=0)
-    orientation = np.sign(np.dot(ridge_point - center, t))
+    # Compute tangent unitary vectors to ridges
+    p1, p2 = vor.points[ridge_points[:, 0]], vor.points[ridge_points[:, 1]]
+    n = p2 - p1
+    n /= np.linalg.norm(n, axis=1, keepdims=True)
+    t = np.stack([-n[:, 1], n[:, 0]], axis=1)
+
+    # Orient vectors by comparing points on ridges to center
+    ridge_point = (p1 + p2) / 2
+    orientation = np.sign(np.sum((ridge_point - center) * t, axis=1, keepdims=True))
     t = orientation * t
 
-    # Create missing point at specified radius following oriented tangent vector
-    missing_point = vor.vertices[v2] + radius * t
-    return missing_point
-
-
-def reconstruct_incomplete_region(vor, point, vertices, ridges, center, radius, new_vertices):
-    """Reconstructs region defined by point, vertices, ridges as a finite region
-    by computing finite endpoints to infinite ridges
-
-    Args:
-        vor (scipy.spatial.Voronoi): Input Voronoi diagram instance
-        point (int): index of region point
-        vertices (list[int]): region vertices indices
-        ridges (list[tuple[int]]): region ridges as [(target_point, vertex_1, vertex_2)]
-        center (np.ndarray): center point
-        radius (float): replacement radius to use for infinite vertices
-
-    Returns:
-        type: list[int], list[np.ndarray]
-    """
-    # Keep finite vertices only at first
-    new_region = [v for v in vertices if v >= 0]
-
-    for target_point, v1, v2 in ridges:
-        # Infinite vertex comes first
-        if v2 < 0:
-            v1, v2 = v2, v1
-        # If actually finite vertex, nothing to change
-        if v1 >= 0:
-            continue
-
-        # Compute the missing endpoint of an infinite ridge as a finite vertex
-        missing_vertex = get_missing_endpoint(vor, point, target_point, v2, center, radius)
-
-        # Record new vertex to region and to vertices list
-        new_region.append(len(new_vertices))
-        new_vertices.append(missing_vertex.tolist())
-
-    return new_region, new_vertices
+    # Create missing points at specified radius following oriented tangent vectors
+    finite_vertices = ridge_vertices.max(axis=1)
+    missing_points = vor.vertices[finite_vertices] + radius * t
+    return missing_points
 
 
-def sort_region(output_region, output_vertices):
-    """Sort region vertices in counterclockwise order
+def sort_regions(region_points, region_vertices, vertices, n_regions):
+    """Gathers vertices of each region and sorts them in counterclockwise order
 
     Args:
-        output_region (list[int]): list of region's vertices indices
-        output_vertices (np.ndarray): vertices
+        region_points (np.ndarray): region point index of each (region, vertex) pair
+        region_vertices (np.ndarray): vertex index of each (region, vertex) pair,
+            pairs may be duplicated
+        vertices (np.ndarray): vertices coordinates
+        n_regions (int): number of regions
 
     Returns:
-        type: list[int]
+        type: list[list[int]]
     """
-    vs = np.asarray([output_vertices[v] for v in output_region])
-    c = vs.mean(axis=0)
-    angles = np.arctan2(vs[:, 1] - c[1], vs[:, 0] - c[0])
-    output_region = np.asarray(output_region)[np.argsort(angles)]
-    return output_region
+    # Drop duplicated (region, vertex) pairs
+    pairs = np.unique(region_points.astype(np.int64) * len(vertices) + region_vertices)
+    region_points, region_vertices = np.divmod(pairs, len(vertices))
+
+    # Compute angle of each vertex around its region center
+    counts = np.bincount(region_points, minlength=n_regions)
+    vs = vertices[region_vertices]
+    c = np.stack([np.bincount(region_points, weights=vs[:, i], minlength=n_regions) for i in range(2)], axis=1)
+    c = c / counts[:, None]
+    angles = np.arctan2(vs[:, 1] - c[region_points, 1], vs[:, 0] - c[region_points, 0])
+
+    # Sort by region then by angle
+    order = np.lexsort((angles, region_points))
+    output_regions = np.split(region_vertices[order], np.cumsum(counts)[:-1])
+    return [region.tolist() for region in output_regions]
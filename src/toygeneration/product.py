@@ -2,7 +2,7 @@ from PIL import Image
 import numpy as np
 import random
 from progress.bar import Bar
-from .export import ProductExport
+from .export import make_export
 from src.utils import setseed
 
 
@@ -167,6 +167,8 @@ class Product(dict):
         """
         # If product defines blobs transformation, use it
         if self.blob_transform:
+            if not isinstance(blob, Image.Image):
+                raise TypeError(f"Blob transformations require PIL-based blobs, got {type(blob).__name__}")
             augmented_blob = self.blob_transform(blob)
             augmented_blob = blob._new(augmented_blob.im)
         # Else use blob as is
@@ -187,6 +189,8 @@ class Product(dict):
             upperleft_loc = self.center2upperleft(loc, (blob_height, blob_width))
             # Paste on background with transparency mask
             y, x = upperleft_loc
+            if not isinstance(blob, Image.Image):
+                blob = Image.fromarray(np.asarray(blob))
             img.paste(blob, (x, y), mask=blob)
         return img
 
@@ -195,14 +199,82 @@ class Product(dict):
         some hidden cache attributes
         iteration
         """
-        for _, blob in self.values():
-            blob.unfreeze()
+        spatial_noises = self._sample_spatial_noises()
+        for idx, (_, blob) in self.items():
+            if idx in spatial_noises:
+                blob.unfreeze(spatial_noise=spatial_noises[idx])
+            else:
+                blob.unfreeze()
         # Save array version of background in cache
         bg_array = np.expand_dims(self.bg, -1)
         bg_array = np.tile(bg_array, self.nbands).astype(np.float64)
         self.bg.array = bg_array
 
-    def generate(self, output_dir, astype='h5'):
+    def _sample_spatial_noises(self):
+        """Draws spatial noise of all blobs sharing a same batch sampler at
+        once - see GPSampler.sample_batch
+
+        Returns:
+            type: dict[np.ndarray]
+        """
+        # Group blobs by sampler and dimensionality
+        groups = dict()
+        for idx, (_, blob) in self.items():
+            sampler = getattr(blob, 'sampler', None)
+            if hasattr(sampler, 'sample_batch'):
+                groups.setdefault((id(sampler), blob.ndim), []).append(idx)
+
+        # Sample all spatial noise of each group in one pass
+        spatial_noises = dict()
+        for (_, ndim), indices in groups.items():
+            blobs = [self[idx][1] for idx in indices]
+            sizes = [(blob.size[1], blob.size[0]) for blob in blobs]
+            noises = blobs[0].sampler.sample_batch(sizes=sizes, n=ndim)
+            spatial_noises.update(zip(indices, noises))
+        return spatial_noises
+
+    def rasterize(self):
+        """Rasterizes registered blobs into a single (height, width) integer label
+        map where each pixel holds the position in registration order of the
+        blob owning it, 0 being background
+
+        Along with label map, gathers blobs time series values over horizon
+        as a (horizon, n_blobs + 1, nbands) array, blobs spatial noise as a
+        (height, width, nbands) array and blobs annotation values such that
+        any frame can then be obtained as `ts_values[t][label_map] + noise_map`
+
+        Blobs are rasterized in registration order such that pixels ownership
+        matches step by step patching - up to pixels valued below float32 epsilon
+        which patching leaves unchanged. Product must have been prepared beforehand
+        as full horizon time series slices are drawn from each blob
+        """
+        # Initialize rasters with background values at position 0
+        height, width = self.bg.array.shape[:2]
+        label_map = np.zeros((height, width), dtype=int)
+        noise_map = np.zeros((height, width, self.nbands))
+        ts_values = np.tile(self.bg.array[0, 0], (self.horizon, len(self) + 1, 1))
+        annotation_values = np.zeros((len(self) + 1, self.annotation_bands))
+
+        for position, (idx, (loc, blob)) in enumerate(self.items(), start=1):
+            # Crop blob footprint and spatial noise given patching location
+            footprint, y, x, h, w = self._crop_patch(label_map, np.asarray(blob) > 0, loc)
+            noise, _, _, _, _ = self._crop_patch(label_map, blob.noise_patch(), loc)
+            footprint = footprint[:h, :w]
+
+            # Record blob ownership and spatial noise over its footprint
+            label_map[y:y + h, x:x + w][footprint] = position
+            noise_map[y:y + h, x:x + w][footprint] = noise[:h, :w][footprint]
+
+            # Record blob time serie values over horizon and annotation values
+            ts_values[:, position] = blob.next_ts_stack(self.horizon)
+            annotation_values[position] = blob.annotation_mask_from(np.ones((1, 1, 1))).flatten()
+
+        self._label_map = label_map
+        self._noise_map = noise_map
+        self._ts_values = ts_values
+        self._annotation_values = annotation_values
+
+    def generate(self, output_dir, astype='h5', batch=False, rasterize=False, compression=None):
         """Runs generation as two for loops :
         ```
         for time_step in horizon:
@@ -211,29 +283,24 @@ class Product(dict):
                 Patch blob on background
             Save resulting image
         ```
+        If batch is True, full horizon is rather rendered at once - see self.render
+        If rasterize is True, frames are gathered from a single label map of
+            blobs instead of patching blobs - see self.rasterize
+
         Args:
             output_dir (str): path to output directory
-            astype (str): in {'h5', 'jpg'}
+            astype (str): in {'h5', 'jpg', 'container', 'memmap'}
+            batch (bool): if True, renders all time steps at once
+            rasterize (bool): if True, gathers frames from label map
+            compression (str): datasets compression for container export
         """
-        # Prepare product and export
-        self.prepare()
-        export = ProductExport(output_dir, astype)
+        # Prepare export
+        export = make_export(output_dir, astype, compression=compression)
         export._setup_output_dir()
         export._init_generation_index(self)
         bar = Bar("Generation", max=self.horizon)
 
-        for i in range(self.horizon):
-            # Create copies of background to preserve original
-            img = self.bg.array.copy()
-            annotation = np.zeros(img.shape[:2] + (self.annotation_bands,))
-
-            for idx, (loc, blob) in self.items():
-                # Update blob in size and pixel values
-                patch, annotation_mask = next(blob)
-                # Patch on background
-                self.patch_array(img, patch, loc)
-                self.patch_array(annotation, annotation_mask, loc)
-
+        for i, (img, annotation) in enumerate(self.stream(batch=batch, rasterize=rasterize)):
             frame_name = '.'.join([f"frame_{i}", astype])
             annotation_name = f"annotation_{i}.h5"
 
@@ -242,12 +309,121 @@ class Product(dict):
 
             # Dump file
             export.dump_frame(img, frame_name)
-            export.dump_annotation(annotation.astype(np.int16), annotation_name)
+            export.dump_annotation(annotation, annotation_name)
             bar.next()
 
         # Save index
         export.dump_index()
 
+    def stream(self, batch=False, rasterize=False):
+        """Yields product frames and annotation masks time step after time step
+        without dumping them, such that they can be directly consumed by
+        degraders - see derivation.derive_stream
+
+        Args:
+            batch (bool): if True, renders all time steps at once
+            rasterize (bool): if True, gathers frames from label map
+
+        Yields:
+            type: (np.ndarray, np.ndarray)
+        """
+        self.prepare()
+
+        # Setup iterator over frames and annotations
+        if rasterize:
+            self.rasterize()
+            frames_iterator = zip(*self.gather()) if batch else self._gather_steps()
+        elif batch:
+            frames_iterator = zip(*self.render())
+        else:
+            frames_iterator = self._iterate_steps()
+
+        for img, annotation in frames_iterator:
+            yield img, annotation.astype(np.int16)
+
+    def _iterate_steps(self):
+        """Iterates over time steps and yields frames and annotation masks one
+        step at a time, patching blobs one after the other
+
+        Frame and annotation buffers are allocated once and overwritten at each
+        time step, yielded arrays must hence be consumed or copied before
+        drawing the next step
+
+        Yields:
+            type: (np.ndarray, np.ndarray)
+        """
+        # Allocate frame and annotation buffers reused across time steps
+        img = np.empty_like(self.bg.array)
+        annotation = np.empty(img.shape[:2] + (self.annotation_bands,))
+        windows = dict()
+
+        for i in range(self.horizon):
+            # Reset buffers to background
+            np.copyto(img, self.bg.array)
+            annotation.fill(0)
+
+            for idx, (loc, blob) in self.items():
+                # Update blob in size and pixel values
+                patch, annotation_mask = next(blob)
+                # Compute patching window once per blob and patch size
+                key = (idx, patch.shape, annotation_mask.shape)
+                if key not in windows:
+                    windows[key] = self._patch_window(img.shape, patch.shape, annotation_mask.shape, loc)
+                # Patch frame and annotation on background in place
+                self.patch_inplace(img, annotation, patch, annotation_mask, windows[key])
+            yield img, annotation
+
+    def render(self):
+        """Renders full horizon at once as frames and annotations stacks
+        Each blob footprint is computed once and its time serie broadcasted
+        along all time steps, such that output matches step by step generation
+
+        Product must have been prepared beforehand and registered blobs must
+        implement a next_stack method (e.g. PolygonCell)
+
+        Returns:
+            type: (np.ndarray, np.ndarray) as (horizon, height, width, nbands)
+                and (horizon, height, width, annotation_bands) arrays
+        """
+        # Create stacked copies of background to preserve original
+        frames = np.tile(self.bg.array, (self.horizon, 1, 1, 1))
+        annotations = np.zeros(frames.shape[:3] + (self.annotation_bands,))
+
+        for idx, (loc, blob) in self.items():
+            # Update blob in size and pixel values over all time steps
+            patches, annotation_masks = blob.next_stack(self.horizon)
+            # Patch on stacked backgrounds
+            self.patch_stack(frames, patches, loc)
+            self.patch_stack(annotations, annotation_masks, loc)
+        return frames, annotations
+
+    def _gather_steps(self):
+        """Iterates over time steps and yields frames and annotation masks one
+        step at a time, gathering values from label map
+        Product must have been rasterized beforehand
+
+        Yields:
+            type: (np.ndarray, np.ndarray)
+        """
+        annotation = self.annotation_values[self.label_map]
+        for t in range(self.horizon):
+            img = self.ts_values[t][self.label_map] + self.noise_map
+            yield img, annotation
+
+    def gather(self):
+        """Gathers full horizon at once as frames and annotations stacks from
+        label map with a single indexing operation
+        Product must have been rasterized beforehand
+
+        Returns:
+            type: (np.ndarray, np.ndarray) as (horizon, height, width, nbands)
+                and (horizon, height, width, annotation_bands) arrays
+        """
+        frames = self.ts_values[:, self.label_map] + self.noise_map
+        annotation = self.annotation_values[self.label_map]
+        annotations = np.broadcast_to(annotation, (self.horizon,) + annotation.shape)
+        return frames, annotations
+
     @setseed('numpy')
     def _rdm_loc(self, seed=None):
         """Draws random location based on product background dimensions
@@ -310,6 +486,87 @@ class Product(dict):
         bg_array[y:y + h, x:x + w][mask] = patch_array[:h, :w][mask].flatten()
         return bg_array
 
+    @staticmethod
+    def _patch_window(bg_shape, patch_shape, annotation_shape, loc):
+        """Computes background and patch slices of patching window, cropped if
+        needed to handle out-of-boundaries patching, along with scratch buffers
+        used to compute patching masks without allocation - see patch_inplace
+
+        Args:
+            bg_shape (tuple[int]): background array shape
+            patch_shape (tuple[int]): shape of array to patch
+            annotation_shape (tuple[int]): shape of annotation mask to patch
+            loc (tuple[int]): patching location
+
+        Returns:
+            type: dict
+        """
+        h, w = patch_shape[:2]
+        y, x = Product.center2upperleft(loc, (h, w))
+
+        # Crop patch if out-of-bounds upper-left patching location
+        patch_y, patch_x = max(0, -y), max(0, -x)
+        y, x = max(0, y), max(0, x)
+
+        # Again crop if out-of-bounds lower-right patching location
+        h = max(0, min(h - patch_y, bg_shape[0] - y))
+        w = max(0, min(w - patch_x, bg_shape[1] - x))
+
+        window = {'bg': (slice(y, y + h), slice(x, x + w)),
+                  'patch': (slice(patch_y, patch_y + h), slice(patch_x, patch_x + w)),
+                  'abs': np.empty((h, w) + patch_shape[2:]),
+                  'mask': np.empty((h, w) + patch_shape[2:], dtype=bool),
+                  'annotation_mask': np.empty((h, w) + annotation_shape[2:], dtype=bool)}
+        return window
+
+    @staticmethod
+    def patch_inplace(img, annotation, patch, annotation_mask, window):
+        """Patches frame and annotation mask arrays in place on precomputed
+        patching window, equivalent to patch_array applied to both
+
+        Args:
+            img (np.ndarray): background frame array, valued in [0, 1]
+            annotation (np.ndarray): background annotation array
+            patch (np.ndarray): array to patch, valued in [0, 1]
+            annotation_mask (np.ndarray): annotation mask to patch
+            window (dict): patching window - see _patch_window
+        """
+        bg_window, patch_window = window['bg'], window['patch']
+        patch = patch[patch_window]
+        annotation_mask = annotation_mask[patch_window]
+
+        # Patch frame where values are not negligible
+        mask = np.greater(np.abs(patch, out=window['abs']), np.finfo(np.float32).eps, out=window['mask'])
+        np.copyto(img[bg_window], patch, where=mask)
+
+        # Patch annotation where labels are defined
+        mask = np.not_equal(annotation_mask, 0, out=window['annotation_mask'])
+        np.copyto(annotation[bg_window], annotation_mask, where=mask)
+
+    @staticmethod
+    def patch_stack(bg_stack, patch_stack, loc):
+        """Patching of stacked numpy arrays into another stack of numpy arrays
+        along leading time axis, i.e. patch_array applied to each time step
+
+        Args:
+            bg_stack (np.ndarray): (n, height, width, channels) background stack
+            patch_stack (np.ndarray): (n, h, w, channels) stack to patch
+            loc (tuple[int]): patching location
+
+        Returns:
+            type: np.ndarray
+        """
+        # Crop it - time axis is moved after spatial dimensions to compute window
+        patch_stack, y, x, h, w = Product._crop_patch(np.moveaxis(bg_stack, 0, 2),
+                                                      np.moveaxis(patch_stack, 0, 2),
+                                                      loc)
+        patch_stack = np.moveaxis(patch_stack[:h, :w], 2, 0)
+
+        # Patch it
+        mask = np.abs(patch_stack) > np.finfo(np.float32).eps
+        np.copyto(bg_stack[:, y:y + h, x:x + w], patch_stack, where=mask)
+        return bg_stack
+
     @staticmethod
     def center2upperleft(loc, patch_size):
         y, x = loc
@@ -360,3 +617,19 @@ class Product(dict):
     @property
     def seed(self):
         return self._seed
+
+    @property
+    def label_map(self):
+        return self._label_map
+
+    @property
+    def noise_map(self):
+        return self._noise_map
+
+    @property
+    def ts_values(self):
+        return self._ts_values
+
+    @property
+    def annotation_values(self):
+        return self._annotation_values
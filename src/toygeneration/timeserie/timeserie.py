@@ -1,4 +1,7 @@
+import os
 import random
+import shutil
+import hashlib
 import numpy as np
 import pandas as pd
 from functools import reduce
@@ -6,27 +9,111 @@ import matplotlib.pyplot as plt
 from torch.utils.data import Dataset
 from sktime.utils.load_data import load_from_tsfile_to_dataframe
 from src.utils import setseed
-from .utils import labels_as_int, pad_to_max_length
+from .utils import labels_as_int, get_each_label_positions
 
 
 class TSDataset(Dataset):
     """Time Series dataset
 
+    Loaded nested dataframe is converted into a dense zero-padded array such
+    that dataset manipulations are carried out with numpy
+
     Args:
         root (str): path to .ts file to load
+        ndim (int): desired time series dimensionality
+        nclass (int): desired number of class
+        rescale (bool): if True, applies minmax rescale to value range
+        cache_dir (str): optional directory where preprocessed dataset is saved
+            and memory-mapped from in later loads
 
     Attributes:
-        data (pd.DataFrame): (n_sample, n_dim) dataframe where columns
-            corresponds to a time serie dimension and rows to a time serie.
-            Time series along one dimension are stored in each cell as pd.Serie
+        data (np.ndarray): (n_sample, max_length, n_dim) float32 array where
+            each time serie is padded with zeros after its length
+        lengths (np.ndarray): (n_sample, ) array with each serie length
         labels (np.ndarray): (n_sample, ) array with each serie label
     """
-    def __init__(self, root, ndim, nclass, rescale=True):
+    _cache_files = ('data', 'lengths', 'labels')
+
+    def __init__(self, root, ndim, nclass, rescale=True, cache_dir=None):
         self.root = root
-        df, labels = load_from_tsfile_to_dataframe(root)
-        self.data = df
-        self.labels = labels_as_int(labels)
-        self._preprocess_dataset(ndim, nclass, rescale)
+        cache_path = self._cache_path(cache_dir, ndim, nclass, rescale) if cache_dir else None
+        if cache_path and os.path.isdir(cache_path):
+            self._load_cache(cache_path)
+        else:
+            df, labels = load_from_tsfile_to_dataframe(root)
+            self.data, self.lengths = self._as_padded_array(df)
+            self.labels = labels_as_int(labels)
+            self._preprocess_dataset(ndim, nclass, rescale)
+            if cache_path:
+                self._dump_cache(cache_path)
+
+    def _cache_path(self, cache_dir, ndim, nclass, rescale):
+        """Cache directory of preprocessed dataset, keyed by .ts file content
+        hash and preprocessing arguments
+
+        Args:
+            cache_dir (str): directory where preprocessed datasets are cached
+            ndim (int): desired time series dimensionality
+            nclass (int): desired number of class
+            rescale (bool): if True, applies minmax rescale to value range
+
+        Returns:
+            type: str
+        """
+        sha1 = hashlib.sha1()
+        with open(self.root, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                sha1.update(chunk)
+        stem = os.path.splitext(os.path.basename(self.root))[0]
+        dirname = f"{stem}_{sha1.hexdigest()[:16]}_ndim_{ndim}_nclass_{nclass}_rescale_{rescale}"
+        return os.path.join(cache_dir, dirname)
+
+    def _load_cache(self, cache_path):
+        """Loads preprocessed dataset arrays, time series being memory-mapped
+
+        Args:
+            cache_path (str): cache directory of preprocessed dataset
+        """
+        self.data = np.load(os.path.join(cache_path, 'data.npy'), mmap_mode='r')
+        self.lengths = np.load(os.path.join(cache_path, 'lengths.npy'))
+        self.labels = np.load(os.path.join(cache_path, 'labels.npy'))
+
+    def _dump_cache(self, cache_path):
+        """Saves preprocessed dataset arrays. Arrays are written in a temporary
+        directory then renamed such that concurrent loads never read partial cache
+
+        Args:
+            cache_path (str): cache directory of preprocessed dataset
+        """
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        for name in self._cache_files:
+            np.save(os.path.join(tmp_path, f'{name}.npy'), getattr(self, name))
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            # Cache has been written by another process meanwhile
+            shutil.rmtree(tmp_path)
+
+    @staticmethod
+    def _as_padded_array(df):
+        """Converts (n_sample, n_dim) nested dataframe where each cell is a
+        pd.Series into zero-padded array. Dimensions of a same serie with
+        mismatching lengths are padded to their max length
+
+        Args:
+            df (pd.DataFrame): (n_sample, n_dim) nested dataframe
+
+        Returns:
+            type: np.ndarray, np.ndarray
+        """
+        rows = [[x.values for x in row] for row in df.itertuples(index=False)]
+        lengths = np.array([max(map(len, row)) for row in rows], dtype=int)
+        data = np.zeros((len(rows), lengths.max(initial=0), df.shape[1]), dtype=np.float32)
+        for i, row in enumerate(rows):
+            for j, x in enumerate(row):
+                data[i, :len(x), j] = x
+        return data, lengths
 
     def _preprocess_dataset(self, ndim, nclass, rescale):
         """Handles optional dataset preprocessing by :
@@ -60,14 +147,8 @@ class TSDataset(Dataset):
         Returns:
             type: (np.ndarray, np.ndarray) or np.ndarray
         """
-        # Extract each dimension array for ts at specified location
-        X = [x.values for x in self.data.iloc[idx]]
-
-        # Stack them with padding if lengths do not match
-        try:
-            X = np.stack(X, axis=1)
-        except ValueError:
-            X = np.stack(pad_to_max_length(X), axis=1)
+        # Extract time serie at specified location without padding
+        X = self.data[idx, :self.lengths[idx]]
 
         # If time step precised, return time serie slice at t
         if t:
@@ -90,26 +171,26 @@ class TSDataset(Dataset):
         return len(self.data)
 
     def _truncate_length(self, length):
-        """Drops rows from dataframe to match specified length
+        """Drops samples from dataset to match specified length
 
         Args:
             length (int): if negative of greater than current length, dataset
                 is left unchanged
         """
         if length < len(self) and length > 0:
-            self.data = self.data.truncate(after=length - 1)
+            self.data = self.data[:length]
+            self.lengths = self.lengths[:length]
             self.labels = self.labels[:length]
 
     def _truncate_dimensions(self, ndim):
-        """Drops columns from dataframe to match specfied number of dimensions
+        """Drops dimensions from dataset to match specfied number of dimensions
 
         Args:
             ndim (int): if negative or greater than max number of dims, dataset
                 is left unchanged
         """
         if ndim >= 0:
-            truncated_dims = self.data.columns[:ndim]
-            self.data = self.data[truncated_dims]
+            self.data = self.data[..., :ndim]
 
     def _reorder(self, indices):
         """Reorders dataset and labels to match provided indices order
@@ -117,25 +198,34 @@ class TSDataset(Dataset):
         Args:
             indices (list[int])
         """
-        self.data = self.data.reindex(indices).reset_index(drop=True)
+        self.data = self.data[indices]
+        self.lengths = self.lengths[indices]
         self.labels = self.labels[indices]
 
     def _min_max_rescale(self, amin=0, amax=1):
         """Rescales dataset time series values in [amin, amax] independently along
-        each dimension/column
+        each dimension, padding values being ignored and left to zero
 
         Args:
             amin (float): minimum affine rescaling value
             amax (float): maximum affine rescaling value
         """
         # Get maximum and minimum value by dimension
-        min_by_dim = [np.min([x.values for x in self.data[col]]) for col in self.data.columns]
-        max_by_dim = [np.max([x.values for x in self.data[col]]) for col in self.data.columns]
+        mask = self._padding_mask()
+        min_by_dim = self.data[mask].min(axis=0)
+        max_by_dim = self.data[mask].max(axis=0)
 
-        # Rescale rows while keeping them encapsulated as pd.Series
-        rescale = lambda x, min, max: (amax - amin) * (x - min) / (max - min) + amin
-        rescale_by_dim = lambda row: pd.Series([rescale(x, min, max) for (x, min, max) in zip(row, min_by_dim, max_by_dim)])
-        self.data = self.data.apply(rescale_by_dim, axis=1)
+        # Rescale all time series at once
+        rescaled_data = (amax - amin) * (self.data - min_by_dim) / (max_by_dim - min_by_dim) + amin
+        self.data = np.where(mask[..., None], rescaled_data, 0).astype(np.float32)
+
+    def _padding_mask(self):
+        """Boolean (n_sample, max_length) array, False at padding positions
+
+        Returns:
+            type: np.ndarray
+        """
+        return np.arange(self.data.shape[1]) < self.lengths[:, None]
 
     def _group_labels(self, n_groups):
         """Processes dataset labels array of size (N, ) filled with C possible
@@ -161,7 +251,7 @@ class TSDataset(Dataset):
         self.labels = new_labels
 
     def plot(self, idx, figsize=(10, 6)):
-        """Quick utility to visualize a time serie from dataframe
+        """Quick utility to visualize a time serie from dataset
 
         Args:
             idx (int): index on time serie to access in self.data
@@ -183,12 +273,37 @@ class TSDataset(Dataset):
             label (int)
             replace (bool): if True, allows to pick same sample multiple times
         """
+        idx = self._draw_indices_given_label(label=label, size=1, replace=replace)[0]
+        return self[idx]
+
+    def _draw_indices_given_label(self, label, size, replace=True):
+        """Draws random indices of samples with specified label
+
+        Without replacement, indices are drawn from a shuffled pool of label
+        samples indices until it is exhausted, then IndexError is raised as in
+        _random_choice
+
+        Args:
+            label (int)
+            size (int): number of indices to draw
+            replace (bool): if True, allows to pick same sample multiple times
+
+        Returns:
+            type: np.ndarray
+        """
+        positions = self.label_positions[label]
         if replace:
-            possible_indices = np.argwhere(self.labels == label).squeeze()
-            idx = np.random.choice(possible_indices)
+            indices = np.random.choice(positions, size=size)
         else:
-            raise NotImplementedError("Random choice by label without replace not implemented yet")
-        return self[idx]
+            if not hasattr(self, '_left_to_draw_by_label'):
+                self._left_to_draw_by_label = dict()
+            if label not in self._left_to_draw_by_label:
+                self._left_to_draw_by_label[label] = np.random.permutation(positions)
+            left_to_draw = self._left_to_draw_by_label[label]
+            if len(left_to_draw) < size:
+                raise IndexError(f"Only {len(left_to_draw)} samples with label {label} left to draw")
+            indices, self._left_to_draw_by_label[label] = left_to_draw[:size], left_to_draw[size:]
+        return indices
 
     def _random_choice(self, replace=True):
         """Mimics random.choice by returning random sample from dataset
@@ -223,6 +338,28 @@ class TSDataset(Dataset):
             output = self._random_choice(replace=replace)
         return output
 
+    @setseed('numpy')
+    def choice_many(self, labels, replace=True, seed=None):
+        """Return random samples with specified labels, series being gathered
+        from dataset at once
+
+        Args:
+            labels (list[int], np.ndarray): label of each sample to draw
+            replace (bool): if True, allows to pick same sample multiple times
+            seed (int): random seed
+
+        Returns:
+            type: list[tuple[np.ndarray, int]]
+        """
+        labels = np.asarray(labels)
+        indices = np.empty(len(labels), dtype=int)
+        for label in np.unique(labels):
+            mask = labels == label
+            indices[mask] = self._draw_indices_given_label(label=label, size=mask.sum(), replace=replace)
+        X = self.data[indices]
+        output = [(x[:length], y) for x, length, y in zip(X, self.lengths[indices], self.labels[indices])]
+        return output
+
     @setseed('numpy')
     def _draw_label_list(self, size, distribution, seed=None):
         """Draws random vector of labels according to multinomial distribution
@@ -240,10 +377,25 @@ class TSDataset(Dataset):
         self._labels_order_list = labels_order_list
 
     def __add__(self, ts_dataset):
-        self.data = pd.concat([self.data, ts_dataset.data])
+        # Pad both datasets time axis to common max length before concatenating
+        max_length = max(self.data.shape[1], ts_dataset.data.shape[1])
+        pad = lambda x: np.pad(x, ((0, 0), (0, max_length - x.shape[1]), (0, 0)))
+        self.data = np.concatenate([pad(self.data), pad(ts_dataset.data)])
+        self.lengths = np.concatenate([self.lengths, ts_dataset.lengths])
         self.labels = np.concatenate([self.labels, ts_dataset.labels])
         return self
 
+    def as_dataframe(self):
+        """Compatibility accessor returning dataset as sktime-like nested
+        dataframe where each cell is a pd.Series
+
+        Returns:
+            type: pd.DataFrame
+        """
+        columns = {f'dim_{j}': [pd.Series(x[:length, j]) for x, length in zip(self.data, self.lengths)]
+                   for j in range(self.ndim)}
+        return pd.DataFrame(columns)
+
     @property
     def root(self):
         return self._root
@@ -252,24 +404,45 @@ class TSDataset(Dataset):
     def data(self):
         return self._data
 
+    @property
+    def lengths(self):
+        return self._lengths
+
     @property
     def labels(self):
         return self._labels
 
     @property
     def ndim(self):
-        return self.data.shape[1]
+        return self.data.shape[-1]
+
+    @property
+    def label_positions(self):
+        """Mapping from each label value to array of samples indices with that
+        label, built at first access
+        """
+        if self._label_positions is None:
+            label_positions = get_each_label_positions(self.labels)
+            self._label_positions = {label: np.array(positions) for label, positions in label_positions.items()}
+        return self._label_positions
 
     @root.setter
     def root(self, root):
         self._root = root
 
     @data.setter
-    def data(self, df):
-        if not isinstance(df, pd.DataFrame):
+    def data(self, data):
+        if not isinstance(data, np.ndarray):
+            raise TypeError
+        else:
+            self._data = data
+
+    @lengths.setter
+    def lengths(self, lengths):
+        if not isinstance(lengths, np.ndarray):
             raise TypeError
         else:
-            self._data = df
+            self._lengths = lengths
 
     @labels.setter
     def labels(self, labels):
@@ -277,6 +450,7 @@ class TSDataset(Dataset):
             raise TypeError
         else:
             self._labels = labels
+            self._label_positions = None
 
 
 class TimeSerie: